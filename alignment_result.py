@@ -0,0 +1,193 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Alignment columns as CIGAR operations: = match, X mismatch, I base of seq1 against a gap, D base of seq2 against a gap
+MATCH, MISMATCH, INSERTION, DELETION = "=", "X", "I", "D"
+CIGAR_PATTERN = re.compile(r"(\d+)([=XID])")
+
+class AlignmentResult:
+    """
+    Pairwise alignment stored as a run-length CIGAR over the two sequences, with its match, mismatch and gap counts.
+    The gapped strings are only built when asked for, as a whole or by column range (blocks), and iterating gives
+    the three strings of the old list form: aligned seq1, comparison line (* match, | mismatch), aligned seq2.
+    """
+
+    __slots__ = ("seq1", "seq2", "start1", "start2", "ops", "lengths", "score", "matches", "mismatches",
+                 "insertions", "deletions", "length", "run_columns", "run_pos1", "run_pos2", "rendered")
+
+    def __init__(self, seq1:str, seq2:str, start1:int, start2:int, ops:str, lengths, score=None):
+        '''
+        :param seq1, seq2: the aligned sequences (ungapped)
+        :param start1, start2: offsets in seq1 and seq2 where the alignment starts (0 for global alignments)
+        :param ops: one CIGAR operation per run, lengths: the length of each run
+        :param score: alignment score, None if unknown
+        '''
+        self.seq1 = seq1
+        self.seq2 = seq2
+        self.start1 = start1
+        self.start2 = start2
+        self.ops = ops
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.score = score
+        kinds = np.frombuffer(ops.encode("ascii"), dtype=np.uint8)
+        totals = {op: int(self.lengths[kinds == ord(op)].sum()) for op in (MATCH, MISMATCH, INSERTION, DELETION)}
+        self.matches = totals[MATCH]
+        self.mismatches = totals[MISMATCH]
+        self.insertions = totals[INSERTION]
+        self.deletions = totals[DELETION]
+        self.length = int(self.lengths.sum())
+        # Where each run starts: alignment column, offset in seq1 and offset in seq2
+        self.run_columns = np.concatenate(([0], np.cumsum(self.lengths)))
+        in_seq1 = np.where(kinds != ord(DELETION), self.lengths, 0)
+        in_seq2 = np.where(kinds != ord(INSERTION), self.lengths, 0)
+        self.run_pos1 = start1 + np.concatenate(([0], np.cumsum(in_seq1)))
+        self.run_pos2 = start2 + np.concatenate(([0], np.cumsum(in_seq2)))
+        self.rendered = None
+
+    @classmethod
+    def from_traceback(cls, seq1:str, seq2:str, start1:int, start2:int, ops:list, score=None):
+        """Result from the per-column operations collected by a traceback, i.e. from the last column backwards."""
+        columns = np.frombuffer("".join(reversed(ops)).encode("ascii"), dtype=np.uint8)
+        if len(columns) == 0:
+            return cls(seq1, seq2, start1, start2, "", [], score)
+        run_starts = np.concatenate(([0], np.flatnonzero(columns[1:] != columns[:-1]) + 1))
+        lengths = np.diff(np.concatenate((run_starts, [len(columns)])))
+        return cls(seq1, seq2, start1, start2, columns[run_starts].tobytes().decode("ascii"), lengths, score)
+
+    @classmethod
+    def from_aligned(cls, aligned1:str, aligned2:str, score=None):
+        """Result from two gapped strings of equal length."""
+        if len(aligned1) != len(aligned2):
+            raise ValueError("Aligned sequences must have the same length")
+        a = np.frombuffer(aligned1.encode("ascii"), dtype=np.uint8)
+        b = np.frombuffer(aligned2.encode("ascii"), dtype=np.uint8)
+        gap = ord("-")
+        columns = np.where(a == gap, ord(DELETION), np.where(b == gap, ord(INSERTION), np.where(a == b, ord(MATCH), ord(MISMATCH))))
+        ops = list(reversed(columns.astype(np.uint8).tobytes().decode("ascii")))
+        return cls.from_traceback(aligned1.replace("-", ""), aligned2.replace("-", ""), 0, 0, ops, score)
+
+    @classmethod
+    def from_dict(cls, data:dict, seq1:str, seq2:str):
+        """Result saved by to_dict, given the two sequences again."""
+        runs = CIGAR_PATTERN.findall(data["cigar"])
+        return cls(seq1, seq2, data["start1"], data["start2"], "".join(op for _, op in runs), [int(n) for n, _ in runs], data.get("score"))
+
+    def to_dict(self):
+        """Compact form without the sequences: CIGAR, start offsets, score and counts."""
+        return {
+            "cigar": self.cigar,
+            "start1": self.start1,
+            "start2": self.start2,
+            "score": self.score,
+            "matches": self.matches,
+            "mismatches": self.mismatches,
+            "gaps": self.gaps,
+            "length": self.length,
+        }
+
+    @property
+    def cigar(self):
+        return "".join(f"{n}{op}" for n, op in zip(self.lengths.tolist(), self.ops))
+
+    @property
+    def gaps(self):
+        return self.insertions + self.deletions
+
+    @property
+    def identity(self):
+        """Percentage of alignment columns that are matches."""
+        return self.matches / self.length * 100 if self.length else 0
+
+    @property
+    def end1(self):
+        return int(self.run_pos1[-1])
+
+    @property
+    def end2(self):
+        return int(self.run_pos2[-1])
+
+    def render(self, start:int = 0, stop:int = None):
+        """Aligned seq1, comparison line and aligned seq2 over the columns [start, stop), only walking the runs involved."""
+        stop = self.length if stop is None else min(stop, self.length)
+        start = max(start, 0)
+        if start >= stop:
+            return "", "", ""
+        parts1, comparison, parts2 = [], [], []
+        r = int(np.searchsorted(self.run_columns, start, side="right")) - 1
+        while r < len(self.ops) and self.run_columns[r] < stop:
+            first = int(self.run_columns[r])
+            skip = max(start - first, 0)
+            n = min(stop, int(self.run_columns[r+1])) - first - skip
+            op = self.ops[r]
+            i = int(self.run_pos1[r]) + (skip if op != DELETION else 0)
+            j = int(self.run_pos2[r]) + (skip if op != INSERTION else 0)
+            parts1.append(self.seq1[i:i+n] if op != DELETION else "-" * n)
+            parts2.append(self.seq2[j:j+n] if op != INSERTION else "-" * n)
+            comparison.append("*" * n if op == MATCH else "|" * n if op == MISMATCH else " " * n)
+            r += 1
+        return "".join(parts1), "".join(comparison), "".join(parts2)
+
+    def strings(self):
+        """The whole alignment as three strings, rendered once."""
+        if self.rendered is None:
+            self.rendered = self.render()
+        return self.rendered
+
+    def __iter__(self):
+        return iter(self.strings())
+
+    def __getitem__(self, index):
+        return self.strings()[index]
+
+    def block_count(self, width:int = 60):
+        return -(-self.length // width)
+
+    def blocks(self, start:int = 0, stop:int = None, width:int = 60):
+        """Blocks start..stop-1 of width columns each, as dicts with block1, comp_line, block2 and the first column."""
+        stop = self.block_count(width) if stop is None else min(stop, self.block_count(width))
+        result = []
+        for k in range(max(start, 0), stop):
+            block1, comp_line, block2 = self.render(k * width, (k + 1) * width)
+            result.append({"block1": block1, "comp_line": comp_line, "block2": block2, "column": k * width})
+        return result
+
+    def __repr__(self):
+        return f"AlignmentResult(score={self.score}, length={self.length}, cigar={self.cigar[:40]}{'...' if len(self.cigar) > 40 else ''})"
+
+class AlignmentStore:
+    """
+    Computed alignments kept under an ID, so a page can fetch blocks of one long after the job that produced it.
+    The ID is derived from the sequences and the CIGAR, so the same alignment is stored once; least recently used evicted first.
+    """
+
+    def __init__(self, capacity:int = 64):
+        self.capacity = capacity
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def alignment_id(self, result:AlignmentResult):
+        digest = hashlib.sha256()
+        for part in (result.seq1, result.seq2, f"{result.start1}:{result.start2}:{result.cigar}"):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()[:16]
+
+    def add(self, result:AlignmentResult):
+        alignment_id = self.alignment_id(result)
+        with self.lock:
+            self.results[alignment_id] = result
+            self.results.move_to_end(alignment_id)
+            while len(self.results) > self.capacity:
+                self.results.popitem(last=False)
+        return alignment_id
+
+    def get(self, alignment_id:str):
+        """The alignment, or None if unknown or evicted."""
+        with self.lock:
+            result = self.results.get(alignment_id)
+            if result is not None:
+                self.results.move_to_end(alignment_id)
+            return result
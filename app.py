@@ -1,9 +1,14 @@
-from flask import Flask, render_template, request
-from part3 import load_genomes, align_genomes, find_motifs, compare_to_reference, visualize_differences_bar
+from flask import Flask, render_template, request, jsonify, g, Response, before_render_template, template_rendered
+from dataset_registry import DatasetRegistry
+from alignment_result import AlignmentStore
+from composition_profile import CollectionProfile
+from jobs import JobQueue, QueueFull
+from part3 import align_genomes, find_motifs, find_conserved_motifs, search_fragment, compare_to_reference_parallel, visualize_differences_bar, COMPARE_METRICS
+from plots import PlotCache, render_gc_bar, render_gc_pie, render_gc_histogram
+from distance_matrix import all_vs_all, load_matrix
 import os
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+import time
+import metrics
 
 
 app = Flask(__name__)
@@ -12,14 +17,176 @@ STATIC_FOLDER = 'static'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['STATIC_FOLDER'] = STATIC_FOLDER
 
-# Ensure necessary folders exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-if not os.path.exists(STATIC_FOLDER):
-    os.makedirs(STATIC_FOLDER)
+# Services shared by every route, built by create_app rather than on import: worker processes of the shared pool
+# (worker_pool) re-import the main module, and must not start job threads or touch the upload folder
+registry = None     # uploaded datasets, keyed by content hash
+jobs = None         # alignments run as background jobs so requests return immediately; pages poll /jobs/<id> for progress
+plot_queue = None   # charts get their own worker so they are not stuck behind long alignments
+plots = None
+alignments = None   # finished alignments by ID: the compare page renders the first blocks and fetches the rest from /alignment/<id>/blocks
 
-# Global variable to store genomes
-genomes = []
+def create_app():
+    """Create the folders and services the routes use (once per process) and return the Flask app."""
+    global registry, jobs, plot_queue, plots, alignments
+    if registry is not None:
+        return app
+    # Ensure necessary folders exist
+    if not os.path.exists(UPLOAD_FOLDER):
+        os.makedirs(UPLOAD_FOLDER)
+    if not os.path.exists(STATIC_FOLDER):
+        os.makedirs(STATIC_FOLDER)
+    # Stage timings are on unless MTDNA_METRICS=0; MTDNA_METRICS_MEMORY=1 adds peak allocations and
+    # MTDNA_PROFILE_DIR enables cProfile dumps of requests sent with ?profile=1
+    metrics.configure_from_environment(default_timing=True)
+    jobs = JobQueue(workers=2, max_pending=16)
+    plot_queue = JobQueue(workers=1, max_pending=64)
+    plots = PlotCache(os.path.join(STATIC_FOLDER, 'plots'), plot_queue)
+    alignments = AlignmentStore(capacity=64)
+    registry = DatasetRegistry(UPLOAD_FOLDER)
+    return app
+
+# All-vs-all results, kept on disk per metric and keyed by sequence hashes so every dataset sharing genomes reuses them
+MATRIX_FOLDER = os.path.join(UPLOAD_FOLDER, 'matrices')
+MAX_MATRIX_TABLE = 50   # largest matrix shown as a table, bigger ones are only served as JSON
+BLOCK_WIDTH = 60
+PAGE_BLOCKS = 50        # blocks rendered with the page and fetched per scroll step
+MAX_PAGE_BLOCKS = 500   # most blocks served by one request
+MAX_FRAGMENT = 10000    # longest fragment searched against a dataset
+
+def resolve_dataset():
+    """
+    Dataset of the current request: a new upload (stored under its content hash) or the dataset_id sent back by the page.
+    :return: the dataset (or None) and an error message (or None)
+    """
+    dataset_id = request.values.get('dataset_id')
+    error_message = None
+    file = request.files.get('fasta_file')
+    if file and file.filename:
+        if file.filename.endswith(('.fasta', '.fa')):
+            dataset_id = registry.add_upload(file)
+        else:
+            error_message = "Invalid file format. Please upload a FASTA file."
+    elif not dataset_id and request.method == 'POST':
+        error_message = "Invalid file format. Please upload a FASTA file."
+    dataset = None
+    if dataset_id:
+        try:
+            dataset = registry.get(dataset_id)
+        except KeyError:
+            error_message = f"Unknown dataset '{dataset_id}'. Please upload the FASTA file again."
+    return dataset, error_message
+
+def finished_job(kind):
+    """
+    Job named by the job_id query parameter, if it is a job of this kind.
+    :return: the job (or None) and an error message (or None) when it failed, was cancelled or has expired
+    """
+    job_id = request.args.get('job_id')
+    if not job_id:
+        return None, None
+    job = jobs.get(job_id)
+    if job is None or job.kind != kind:
+        return None, "This job has expired, please run it again."
+    if job.status == "failed":
+        return job, f"Job failed: {job.error}"
+    if job.status == "cancelled":
+        return job, "Job cancelled."
+    return job, None
+
+def run_comparison(g1, g2, progress):
+    """Align two genomes and summarize the alignment (runs as a background job)."""
+    progress(0, 1)
+    alignment = align_genomes(g1, g2)  # Use the function from part3.py
+    progress(1, 1)
+    # Match/mismatch/gap counts straight from the alignment's CIGAR; blocks are rendered per page from the stored alignment
+    summary = visualize_differences_bar(alignment, label1=g1.ID, label2=g2.ID, block_size=BLOCK_WIDTH, stop=0)[1]
+    return alignments.add(alignment), summary
+
+def run_reference_comparison(dataset, reference, targets, top_n, min_similarity, metric, progress):
+    """Compare targets to the reference (runs as a background job); the dataset's MinHash sketches rank them first if filtering."""
+    sketches = dataset.get_sketches() if top_n is not None or min_similarity is not None else None
+    return compare_to_reference_parallel(reference, targets, progress=progress, top_n=top_n, min_similarity=min_similarity, sketches=sketches, metric=metric)  # Use the function from part3.py
+
+def find_job(job_id):
+    """Job of either queue, or None if unknown or expired."""
+    return jobs.get(job_id) or plot_queue.get(job_id)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status and progress of a background job, polled by the result pages."""
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running job."""
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    jobs.cancel(job_id) or plot_queue.cancel(job_id)
+    return jsonify(job.to_dict())
+
+@app.route('/alignment/<alignment_id>/blocks')
+def alignment_blocks(alignment_id):
+    """Blocks start..stop-1 of a computed alignment, rendered on request (at most MAX_PAGE_BLOCKS at a time)."""
+    alignment = alignments.get(alignment_id)
+    if alignment is None:
+        return jsonify({"error": "Unknown or expired alignment"}), 404
+    try:
+        start = max(int(request.args.get('start', 0)), 0)
+        stop = int(request.args.get('stop', start + PAGE_BLOCKS))
+    except ValueError:
+        return jsonify({"error": "start and stop must be integers"}), 400
+    stop = min(stop, start + MAX_PAGE_BLOCKS)
+    blocks, summary = visualize_differences_bar(alignment, block_size=BLOCK_WIDTH, start=start, stop=stop)
+    return jsonify({
+        "alignment_id": alignment_id,
+        "start": start,
+        "stop": start + len(blocks),
+        "total_blocks": summary["blocks"],
+        "blocks": blocks,
+    })
+
+@app.before_request
+def start_request_metrics():
+    if metrics.settings.timing:
+        g.request_start = time.perf_counter()
+    if metrics.settings.profile_dir and request.args.get('profile'):
+        g.profiler = metrics.RequestProfiler(request.endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    profiler = g.pop('profiler', None)
+    if profiler:
+        response.headers['X-Profile'] = os.path.basename(profiler.dump())
+    start = g.pop('request_start', None)
+    if start is not None:
+        metrics.registry.observe("mtdna_request_seconds", time.perf_counter() - start, endpoint=request.endpoint or "unknown")
+    return response
+
+def submit_job(kind, func, *args):
+    """Queue an analysis; under a profiled request (?profile=1) its job thread gets its own cProfile dump."""
+    if g.get('profiler'):
+        func = metrics.profiled(f"{request.endpoint}-job", func)
+    return jobs.submit(kind, func, *args)
+
+@before_render_template.connect_via(app)
+def start_render_metrics(sender, template, context, **extra):
+    if metrics.settings.timing:
+        g.render_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_render_metrics(sender, template, context, **extra):
+    start = g.pop('render_start', None)
+    if start is not None:
+        metrics.registry.observe("mtdna_stage_seconds", time.perf_counter() - start, stage="render_template")
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage and request metrics in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def home():
@@ -29,79 +196,83 @@ def home():
 @app.route('/compare', methods=['GET', 'POST'])
 def compare_genomes():
     """Compare two genomes."""
-    global genomes
     comparison_result = None
     summary = None
-    error_message = None
+    alignment_id = None
+    job = None
+    status = 200
+    dataset, error_message = resolve_dataset()
+    genomes = dataset.genomes if dataset else []
 
     if request.method == 'POST':
-        # Handle file upload
-        file = request.files.get('fasta_file')
-        if file and file.filename.endswith(('.fasta', '.fa')):
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(filepath)
-            genomes = load_genomes(filepath)  # Use the function from part3.py
-        else:
-            error_message = "Invalid file format. Please upload a FASTA file."
-
-        # Perform genome comparison if IDs are provided
+        # Queue the genome comparison if IDs are provided
         id1 = request.form.get('id1')
         id2 = request.form.get('id2')
-        if id1 and id2 and genomes:
-            g1 = next((g for g in genomes if g.ID == id1), None)
-            g2 = next((g for g in genomes if g.ID == id2), None)
+        if id1 and id2 and dataset:
+            g1 = dataset.get_genome(id1)
+            g2 = dataset.get_genome(id2)
 
             if g1 and g2:
-                # Align genomes and generate comparison result
-                aligned_seq1, comparison_line, aligned_seq2 = align_genomes(g1, g2)  # Use the function from part3.py
-                comparison_result = [
-                    {"block1": aligned_seq1, "comp_line": comparison_line, "block2": aligned_seq2}
-                ]
-                # Generate summary statistics
-                matches = comparison_line.count('|')
-                mismatches = comparison_line.count('*')
-                gaps = aligned_seq1.count('-') + aligned_seq2.count('-')
-                total = len(comparison_line)
-                summary = {
-                    "matches": matches,
-                    "mismatches": mismatches,
-                    "gaps": gaps,
-                    "total": total
-                }
+                try:
+                    job = submit_job('compare', run_comparison, g1, g2)
+                except QueueFull as e:
+                    error_message, status = str(e), 503
+    else:
+        job, job_error = finished_job('compare')
+        error_message = error_message or job_error
+        if job and job.status == "done":
+            alignment_id, summary = job.result
+            alignment = alignments.get(alignment_id)
+            if alignment is None:
+                error_message, summary = "This alignment has expired, please run it again.", None
+            else:
+                # Only the first page of blocks; the page loads the next ones from alignment_blocks as it is scrolled
+                comparison_result = visualize_differences_bar(alignment, block_size=BLOCK_WIDTH, stop=PAGE_BLOCKS)[0]
 
-    return render_template('compare.html', genomes=genomes, comparison_result=comparison_result, summary=summary, error_message=error_message)
+    return render_template('compare.html', genomes=genomes, dataset_id=dataset.id if dataset else None, comparison_result=comparison_result, summary=summary,
+                           alignment_id=alignment_id, page_blocks=PAGE_BLOCKS, job=job, error_message=error_message), status
 
 @app.route('/motif_search', methods=['GET', 'POST'])
 def motif_search():
     """Find conserved motifs and specific motif positions."""
-    global genomes
     motifs = []  # Initialize motifs as an empty list
     conservation_matrix = None
     motif_results = []
     specific_motif = None  # Initialize specific_motif to avoid UnboundLocalError
-    error_message = None
+    max_mismatches = 0
+    motif_length = 8
+    dataset, error_message = resolve_dataset()
+    genomes = dataset.genomes if dataset else []
 
     if request.method == 'POST':
-        # Handle file upload
-        file = request.files.get('fasta_file')
-        if file and file.filename.endswith(('.fasta', '.fa')):
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(filepath)
-            genomes = load_genomes(filepath)  # Use the function from part3.py
-        else:
-            error_message = "Invalid file format. Please upload a FASTA file."
-
         # Perform specific motif search
         specific_motif = request.form.get('specific_motif')  # User provides a single motif
-        if specific_motif and genomes:
-            motif_results = find_motifs(genomes, specific_motif)  # Use the function from part3.py
+        try:
+            max_mismatches = min(max(int(request.form.get('max_mismatches') or 0), 0), 3)
+            motif_length = min(max(int(request.form.get('motif_length') or 8), 4), 12)
+        except ValueError:
+            error_message = "Allowed mismatches and motif length must be numbers."
+        if specific_motif and dataset and not error_message:
+            # One FM-index over the whole dataset, built once and memory-mapped from disk afterwards
+            index = dataset.get_collection_index()
+            try:
+                motif_results = find_motifs(genomes, specific_motif, index=index, max_mismatches=max_mismatches)  # Use the function from part3.py
+            except ValueError as e:
+                error_message = str(e)
+
+    if dataset and genomes and not error_message:
+        # Conserved motifs: k-mer counts are computed once per dataset and motif length
+        motifs, conservation_matrix = find_conserved_motifs(genomes, counter=dataset.get_kmer_counter(motif_length))
 
     return render_template(
         'motif_search.html',
         genomes=genomes,
+        dataset_id=dataset.id if dataset else None,
         motifs=motifs,
         conservation_matrix=conservation_matrix,
         specific_motif=specific_motif,
+        max_mismatches=max_mismatches,
+        motif_length=motif_length,
         motif_results=motif_results,
         error_message=error_message
     )
@@ -109,132 +280,170 @@ def motif_search():
 @app.route('/reference', methods=['GET', 'POST'])
 def reference_genome():
     """Compare genomes to a reference genome."""
-    global genomes
     results = None
-    reference_id = None
-    error_message = None
+    reference_id = request.values.get('reference_id')
+    top_n = None
+    min_similarity = None
+    metric = request.values.get('metric', 'alignment')
+    job = None
+    status = 200
+    dataset, error_message = resolve_dataset()
+    genomes = dataset.genomes if dataset else []
 
     if request.method == 'POST':
-        # Handle file upload
-        if 'fasta_file' in request.files:
-            file = request.files.get('fasta_file')
-            if file and file.filename.endswith(('.fasta', '.fa')):
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-                file.save(filepath)
-                genomes = load_genomes(filepath)  # Use the function from part3.py
-            else:
-                error_message = "Invalid file format. Please upload a FASTA file."
-
+        try:
+            top_n = max(int(request.form['top_n']), 1) if request.form.get('top_n') else None
+            min_similarity = min(max(float(request.form['min_similarity']), 0), 100) if request.form.get('min_similarity') else None
+        except ValueError:
+            error_message = "Closest genomes and minimum similarity must be numbers."
+        if metric not in COMPARE_METRICS:
+            error_message = f"Unknown metric '{metric}'."
         # Handle reference genome selection
-        reference_id = request.form.get('reference_id')
-        if reference_id and genomes:
-            reference = next((g for g in genomes if g.ID == reference_id), None)
+        if reference_id and dataset and not error_message:
+            reference = dataset.get_genome(reference_id)
             if reference:
-                results = compare_to_reference(reference, [g for g in genomes if g.ID != reference_id])  # Use the function from part3.py
+                targets = [g for g in genomes if g.ID != reference_id]
+                try:
+                    job = submit_job('reference', run_reference_comparison, dataset, reference, targets, top_n, min_similarity, metric)
+                except QueueFull as e:
+                    error_message, status = str(e), 503
             else:
                 error_message = f"Reference genome with ID '{reference_id}' not found."
+    else:
+        job, job_error = finished_job('reference')
+        error_message = error_message or job_error
+        if job and job.status == "done":
+            results = job.result
 
-    return render_template('reference.html', genomes=genomes, results=results, reference_id=reference_id, error_message=error_message)
+    return render_template('reference.html', genomes=genomes, dataset_id=dataset.id if dataset else None, results=results, reference_id=reference_id, top_n=top_n, min_similarity=min_similarity, metric=metric, job=job, error_message=error_message), status
 
-def plot_gc(stats):
-    """
-    Generate a GC content histogram for all sequences with repeating colors after all colors are used.
-    :param stats: List of dictionaries containing sequence statistics.
-    :return: Path to the saved plot.
-    """
-    ids = [entry["id"] for entry in stats]
-    gc = [entry["gc_content"] for entry in stats]
-
-    # Generate a colormap with a fixed number of distinct colors (e.g., 20 colors)
-    num_colors = 20  # Number of distinct colors in the colormap
-    cmap = plt.cm.get_cmap('tab20', num_colors)  # Use 'tab20' colormap with 20 colors
-    colors = [cmap(i % num_colors) for i in range(len(ids))]  # Cycle through colors using modular arithmetic
-
-    plt.figure(figsize=(12, 6))
-    plt.bar(ids, gc, color=colors, width=0.5)
-    plt.xlabel("Sequence ID")
-    plt.ylabel("GC Content (%)")
-    plt.title("GC Content of Sequences")
-    plt.ylim(0, 100)  # Set y-axis to percentage scale
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
-
-    plot_path = os.path.join(app.config['STATIC_FOLDER'], 'gc_histogram.png')
-    plt.savefig(plot_path)
-    plt.close()
-    return plot_path
+def run_matrix(genomes, metric, progress):
+    """All-vs-all comparison of a dataset (runs as a background job), only computing the pairs not stored yet."""
+    return all_vs_all(genomes, metric, folder=MATRIX_FOLDER, progress=progress)
+
+@app.route('/matrix', methods=['GET', 'POST'])
+def distance_matrix():
+    """Pairwise similarity of every genome of a dataset: computed in the background, then served from disk."""
+    matrix = None
+    metric = request.values.get('metric', 'edit_distance')
+    job = None
+    status = 200
+    dataset, error_message = resolve_dataset()
+    genomes = dataset.genomes if dataset else []
+    if metric not in COMPARE_METRICS:
+        error_message, metric = f"Unknown metric '{metric}'.", 'edit_distance'
+
+    if request.method == 'POST':
+        if dataset and not error_message:
+            try:
+                job = submit_job('matrix', run_matrix, genomes, metric)
+            except QueueFull as e:
+                error_message, status = str(e), 503
+    else:
+        job, job_error = finished_job('matrix')
+        error_message = error_message or job_error
+        if job and job.status == "done":
+            matrix = job.result
+        elif dataset and not job_error:
+            matrix = load_matrix(genomes, metric, folder=MATRIX_FOLDER)  # every pair already stored: nothing to align
+        if request.args.get('format') == 'json':
+            if matrix is None:
+                return jsonify({"error": error_message or "Matrix not computed yet, submit the dataset first"}), 404
+            return jsonify(matrix.to_dict())
+
+    table = matrix.square().round(1).tolist() if matrix is not None and len(matrix.ids) <= MAX_MATRIX_TABLE else None
+    return render_template('matrix.html', dataset_id=dataset.id if dataset else None, genomes=genomes, metric=metric, matrix=matrix,
+                           table=table, max_table=MAX_MATRIX_TABLE, job=job, error_message=error_message), status
+
+def run_fragment_search(dataset, query, top_n, progress):
+    """Seed-and-extend search of a fragment against a whole dataset (runs as a background job), seeded from its FM-index."""
+    return search_fragment(dataset.genomes, query, index=dataset.get_collection_index(), top_n=top_n, progress=progress)
+
+@app.route('/fragment_search', methods=['GET', 'POST'])
+def fragment_search():
+    """Local hits of a sequence fragment in every genome of a dataset."""
+    results = None
+    top_n = 20
+    job = None
+    status = 200
+    dataset, error_message = resolve_dataset()
+
+    if request.method == 'POST':
+        query = "".join(request.form.get('query', '').split())
+        try:
+            top_n = max(int(request.form.get('top_n') or 20), 1)
+        except ValueError:
+            error_message = "Number of hits must be a number."
+        if not query or len(query) > MAX_FRAGMENT:
+            error_message = error_message or f"Enter a fragment of at most {MAX_FRAGMENT} bases."
+        if dataset and not error_message:
+            try:
+                job = submit_job('fragment', run_fragment_search, dataset, query, top_n)
+            except QueueFull as e:
+                error_message, status = str(e), 503
+    else:
+        job, job_error = finished_job('fragment')
+        error_message = error_message or job_error
+        if job and job.status == "done":
+            results = job.result
+
+    return render_template('fragment_search.html', dataset_id=dataset.id if dataset else None, results=results, top_n=top_n, job=job, error_message=error_message), status
 
 @app.route('/statistics', methods=['GET', 'POST'])
 def genome_statistics():
     """Page for viewing FASTA sequence statistics."""
-    global genomes
     stats = []
-    error_message = None
-    gc_bar_chart_path = None
-    gc_pie_chart_path = None
-    gc_species_histogram_path = None
+    plot_urls = {}
+    plot_jobs = {}
+    window = 500
+    step = 100
+    dataset, error_message = resolve_dataset()
 
     if request.method == 'POST':
-        # Handle file upload
-        file = request.files.get('fasta_file')
-        if file and file.filename.endswith(('.fasta', '.fa')):
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(filepath)
-            genomes = load_genomes(filepath)  # Use the function from part3.py
-
-            # Calculate statistics
+        try:
+            window = max(int(request.form.get('window') or window), 1)
+            step = max(int(request.form.get('step') or step), 1)
+        except ValueError:
+            error_message = "Window and step must be numbers."
+        if dataset and not error_message:
+            genomes = dataset.genomes
+
+            # Calculate statistics; windowed profiles come from prefix counts built once per dataset
+            profile = dataset.get_derived('profile', lambda d: CollectionProfile([g.codes for g in d.genomes], [g.ID for g in d.genomes]))
+            window_gc = profile.summary(window, step, "gc")
+            window_skew = profile.summary(window, step, "gc_skew")
             stats = [
                 {
                     "id": genome.ID,
                     "description": genome.description,
-                    "length": len(genome.seq),
-                    "gc_content": round((genome.seq.count('G') + genome.seq.count('C')) / len(genome.seq) * 100, 2)
+                    "length": genome.get_length(),
+                    "gc_content": round(genome.get_GC_content(), 2),
+                    "window_gc_min": round(window_gc[genome.ID][0], 2) if window_gc[genome.ID] else "-",
+                    "window_gc_max": round(window_gc[genome.ID][2], 2) if window_gc[genome.ID] else "-",
+                    "gc_skew_range": f"{window_skew[genome.ID][0]:.3f} to {window_skew[genome.ID][2]:.3f}" if window_skew[genome.ID] else "-"
                 }
                 for genome in genomes
             ]
 
-            # Generate GC content bar chart
-            gc_bar_chart_path = plot_gc(stats)
-
-            # Generate overall GC content pie chart
+            # Charts are cached per dataset and drawn by a background worker; the page shows them once ready
+            ids = [stat["id"] for stat in stats]
+            gc_contents = [stat["gc_content"] for stat in stats]
             total_bases = sum(stat["length"] for stat in stats)
             total_gc_bases = sum((stat["gc_content"] / 100) * stat["length"] for stat in stats)
-            total_at_bases = total_bases - total_gc_bases
-            plt.figure(figsize=(8, 8))
-            plt.pie(
-                [total_gc_bases, total_at_bases],
-                labels=["GC Content", "AT Content"],
-                autopct='%1.1f%%',
-                colors=["orange", "skyblue"],
-                startangle=140
-            )
-            plt.title("Overall GC Content in File")
-            gc_pie_chart_path = os.path.join(app.config['STATIC_FOLDER'], 'gc_pie_chart.png')
-            plt.savefig(gc_pie_chart_path)
-            plt.close()
-
-            # Generate GC content distribution histogram
-            gc_contents = [stat["gc_content"] for stat in stats]
-            plt.figure(figsize=(10, 6))
-            plt.hist(gc_contents, bins=10, color='teal', edgecolor='black')
-            plt.title("GC Content Distribution Across Species")
-            plt.xlabel("GC Content (%)")
-            plt.ylabel("Frequency")
-            gc_species_histogram_path = os.path.join(app.config['STATIC_FOLDER'], 'gc_species_histogram.png')
-            plt.savefig(gc_species_histogram_path)
-            plt.close()
-
-        else:
-            error_message = "Invalid file format. Please upload a FASTA file."
+            plot_urls['gc_bar_chart'], plot_jobs['gc_bar_chart'] = plots.request(dataset.id, 'gc_bar', render_gc_bar, ids, gc_contents)
+            plot_urls['gc_pie_chart'], plot_jobs['gc_pie_chart'] = plots.request(dataset.id, 'gc_pie', render_gc_pie, total_gc_bases, total_bases - total_gc_bases)
+            plot_urls['gc_species_histogram'], plot_jobs['gc_species_histogram'] = plots.request(dataset.id, 'gc_histogram', render_gc_histogram, gc_contents, bins=10)
 
     return render_template(
         'statistics.html',
         stats=stats,
+        dataset_id=dataset.id if dataset else None,
         error_message=error_message,
-        gc_bar_chart_path='/static/gc_histogram.png',
-        gc_pie_chart_path='/static/gc_pie_chart.png',
-        gc_species_histogram_path='/static/gc_species_histogram.png'
+        window=window,
+        step=step,
+        plot_urls=plot_urls,
+        plot_jobs={name: job.id for name, job in plot_jobs.items() if job}
     )
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
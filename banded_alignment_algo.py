@@ -0,0 +1,138 @@
+# Banded Needleman-Wunsch / Smith-Waterman: only the cells whose diagonal d = j - i lies in [lo, hi] are computed,
+# stored as (m+1) x (hi-lo+1) band rows. For closely related genomes the optimal path stays near the main
+# diagonal, so a narrow band gives the optimal score at a fraction of the full DP.
+
+import numpy as np
+from numpy_alignment_algo import STOP, DIAG, UP, LEFT, encodeSequence
+from alignment_result import AlignmentResult, MATCH, MISMATCH, INSERTION, DELETION
+
+NEG = -(1 << 40)                                                      # score of cells outside the matrix
+
+def bandedMatrix(A, B, gap_pen, match, mismatch, lo, hi, local, keep_codes=True):
+    # Band row i holds columns j = i + lo + k for k in 0..W-1. In these coordinates DIAG reads the previous
+    # row at the same k, UP at k+1 and LEFT the current row at k-1, so a row is filled like the full NumPy rows
+    m = len(A)
+    n = len(B)
+    W = hi - lo + 1
+    codesA = encodeSequence(A)
+    ks = np.arange(W, dtype=np.int64)
+    kramp = ks * gap_pen                                              # LEFT moves along k, shift by k*gap_pen for a running maximum
+    # windows[i] holds B[j-1] for the band columns of row i (0 where j-1 falls outside B)
+    padded = np.zeros(n + 2 * (W + m + abs(lo)) + 2, dtype=encodeSequence(B).dtype)
+    offset = W + m + abs(lo) + 1
+    padded[offset:offset+n] = encodeSequence(B)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, W)
+    codes = np.zeros((m + 1, W), dtype=np.uint8) if keep_codes else None
+    # Row 0
+    cols = lo + ks
+    inside = (cols >= 0) & (cols <= n)
+    prev = np.where(inside, 0 if local else cols * gap_pen, NEG)
+    if keep_codes:
+        codes[0] = np.where(cols > 0, STOP if local else LEFT, STOP)
+    max_score, max_i, max_j = 0, 0, 0
+    v2 = np.full(W, NEG, dtype=np.int64)
+    for i in range(1, m + 1):
+        subs = np.where(windows[offset + i + lo - 1] == codesA[i-1], match, mismatch)
+        v1 = prev + subs                                              # DIAG from (i-1, j-1)
+        v2[:-1] = prev[1:]
+        v2[:-1] += gap_pen                                            # UP from (i-1, j)
+        edge = i + lo < 1 or i + hi > n                               # the band crosses column 0 or column n on this row
+        if edge:
+            cols = i + lo + ks
+            inside = (cols >= 0) & (cols <= n)
+            v1[~inside | (cols < 1)] = NEG
+            v2[~inside] = NEG
+        best = np.maximum(v1, v2)
+        if local:
+            np.maximum(best, 0, out=best)
+        if edge:
+            best[~inside] = NEG
+            col0 = -i - lo                                            # band index of column 0, if the band reaches it
+            if 0 <= col0 < W:
+                best[col0] = 0 if local else i * gap_pen
+        best -= kramp
+        cur = np.maximum.accumulate(best)
+        cur += kramp
+        if edge:
+            cur[~inside] = NEG
+        if keep_codes:
+            row = codes[i]
+            np.subtract(LEFT, (cur == v2).view(np.uint8), out=row)  # DIAG, else UP, else LEFT as in the full DP
+            np.right_shift(row, (cur == v1).view(np.uint8), out=row)
+            if local:
+                np.multiply(row, cur != 0, out=row)
+            if edge and 0 <= col0 < W:
+                row[col0] = STOP if local else UP
+        if local:
+            row_max = cur.max()
+            if row_max > max_score:
+                max_score, max_i, max_j = int(row_max), i, i + lo + int(cur.argmax())
+        prev = cur
+    if local:
+        return codes, max_score, max_i, max_j
+    return codes, int(prev[n - m - lo]), m, n
+
+def tracebackBanded(A, B, i, j, lo, codes):
+    # CIGAR operations from (i, j) back to a STOP cell, last column first, and the cell where the alignment starts
+    ops = []
+    while True:
+        code = codes[i, j - i - lo]
+        if code == STOP:
+            break
+        if code == DIAG:
+            ops.append(MATCH if A[i-1] == B[j-1] else MISMATCH)
+            i -= 1
+            j -= 1
+        elif code == UP:
+            ops.append(INSERTION)
+            i -= 1
+        else:
+            ops.append(DELETION)
+            j -= 1
+    return i, j, ops
+
+def bandLimits(m, n, band):
+    # Diagonals from both ends of the matrix, widened by band on each side
+    return min(0, n - m) - band, max(0, n - m) + band
+
+def outsideBound(m, n, gap_pen, match, mismatch, lo, hi):
+    # Highest score any global path leaving [lo, hi] could reach: it has to touch diagonal lo-1 or hi+1,
+    # which costs at least G gaps, and every other step is at best a match
+    G = min((n - m) - 2 * (lo - 1), 2 * (hi + 1) - (n - m))
+    best_sub = max(match, mismatch)
+    with_min_gaps = ((m + n - G) // 2) * best_sub + G * gap_pen
+    all_gaps = (m + n) * gap_pen
+    return max(with_min_gaps, all_gaps)
+
+def bandedGlobal(A, B, gap_pen, match, mismatch, band, adaptive, keep_codes):
+    # Run the band, doubling it while adaptive and the score is not provably optimal
+    m = len(A)
+    n = len(B)
+    while True:
+        lo, hi = bandLimits(m, n, band)
+        codes, score, _, _ = bandedMatrix(A, B, gap_pen, match, mismatch, lo, hi, False, keep_codes)
+        covers_all = lo <= -m and hi >= n
+        sufficient = covers_all or score >= outsideBound(m, n, gap_pen, match, mismatch, lo, hi)
+        if sufficient or not adaptive:
+            return codes, score, lo, band, sufficient
+        band = max(1, band * 2)                                       # a zero band would never grow
+
+def globalAlignmentBanded(A, B, gap_pen, match, mismatch, band=32, adaptive=False):
+    '''
+    :return: alignment, score, band width used, and whether the band provably contains an optimal alignment
+    '''
+    codes, score, lo, band, sufficient = bandedGlobal(A, B, gap_pen, match, mismatch, band, adaptive, True)
+    i, j, ops = tracebackBanded(A, B, len(A), len(B), lo, codes)
+    alignment = AlignmentResult.from_traceback(A, B, i, j, ops, score)
+    return alignment, score, band, sufficient
+
+def globalScoreBanded(A, B, gap_pen, match, mismatch, band=32, adaptive=False):
+    _, score, _, band, sufficient = bandedGlobal(A, B, gap_pen, match, mismatch, band, adaptive, False)
+    return score, band, sufficient
+
+def localAlignmentBanded(A, B, gap_pen, match, mismatch, lo, hi):
+    # Smith-Waterman restricted to diagonals lo..hi (no optimality guarantee outside the band)
+    codes, max_score, max_i, max_j = bandedMatrix(A, B, gap_pen, match, mismatch, lo, hi, True)
+    i, j, ops = tracebackBanded(A, B, max_i, max_j, lo, codes)
+    alignment = AlignmentResult.from_traceback(A, B, i, j, ops, max_score)
+    return alignment, max_score
@@ -0,0 +1,332 @@
+# Benchmark suite for parsing, indexing, searching and alignment
+#
+#   python benchmark.py                                   # quick profile, results printed as JSON
+#   python benchmark.py --output baseline.json            # store a baseline
+#   python benchmark.py --compare baseline.json           # rerun and flag regressions (exit code 1)
+#   python benchmark.py --profile full --stages parse,fm_index_build
+#
+# Genomes are synthetic and seeded: a random ancestor per case, each genome derived from it with the given divergence,
+# so a run is reproducible from its parameters alone.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from fm_index_query import BWT, FMIndex, FMIndexQuery, CollectionFMIndex
+from global_alignment_algo import globalAlignment
+from local_alignment_algo import localAlignment
+from edit_distance_algo import editDistance
+from parser import read_fasta, parser
+from models import MitochondrialDNA, SequenceAlignment
+from part3 import compare_to_reference
+from distance_matrix import all_vs_all
+from kmer_counter import KmerCounter
+from minhash_sketch import SketchCollection, sketchHashes
+from seed_extend import seedAndExtend
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+def generate_genomes(count:int, length:int, divergence:float, seed:int):
+    """
+    Synthetic genomes derived from one random ancestor.
+    :param divergence: fraction of positions substituted in each genome; a tenth of that rate is used for 1-3 base insertions and deletions
+    :return: list of (ID, sequence)
+    """
+    rng = np.random.default_rng(seed)
+    ancestor = BASES[rng.integers(0, 4, length)]
+    genomes = []
+    for i in range(count):
+        seq = ancestor.copy()
+        substituted = rng.random(length) < divergence
+        seq[substituted] = BASES[rng.integers(0, 4, int(substituted.sum()))]
+        indels = np.sort(rng.choice(length, size=int(length * divergence / 10), replace=False))
+        parts, last = [], 0
+        for position in indels:
+            # An event inside the previous deletion starts where that deletion ends: the cursor never moves back,
+            # which would copy the deleted bases again
+            parts.append(seq[last:position])
+            size = int(rng.integers(1, 4))
+            if rng.random() < 0.5:
+                parts.append(BASES[rng.integers(0, 4, size)])  # insertion
+                last = max(last, position)
+            else:
+                last = max(last, position + size)  # deletion
+        parts.append(seq[last:])
+        genomes.append((f"SYN_{i+1:06d}", np.concatenate(parts).tobytes().decode("ascii")))
+    return genomes
+
+def write_fasta(genomes, path:str, width:int = 70):
+    with open(path, "w") as out:
+        for ID, seq in genomes:
+            out.write(f">{ID} Synthetic mitochondrion, complete genome\n")
+            for start in range(0, len(seq), width):
+                out.write(seq[start:start+width] + "\n")
+
+def measure(func, repeat:int):
+    """Best and median wall time over repeat runs, then the peak traced allocation of one more run."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "median_seconds": float(np.median(times)), "peak_bytes": peak}
+
+# Each stage is prepared once from (genomes, fasta path, case) and returns the callable that is measured
+def stage_parse(genomes, path, case):
+    return lambda: sum(1 for _ in read_fasta(path))
+
+def stage_parse_dataframe(genomes, path, case):
+    return lambda: parser(path)
+
+def stage_bwt(genomes, path, case):
+    seq = genomes[0][1]
+    return lambda: BWT(seq)
+
+def stage_fm_index_build(genomes, path, case):
+    seq = genomes[0][1]
+    return lambda: FMIndex(seq)
+
+def stage_fm_query(genomes, path, case):
+    seq = genomes[0][1]
+    return lambda: FMIndexQuery(seq, "GATC")
+
+def stage_fm_locate(genomes, path, case):
+    index = FMIndex(genomes[0][1])
+    motifs = motifs_from(genomes, case)
+    return lambda: [index.locate(motif) for motif in motifs]
+
+def stage_collection_index_build(genomes, path, case):
+    seqs, ids = [seq for _, seq in genomes], [ID for ID, _ in genomes]
+    return lambda: CollectionFMIndex(seqs, ids)
+
+def stage_collection_search(genomes, path, case):
+    index = CollectionFMIndex([seq for _, seq in genomes], [ID for ID, _ in genomes])
+    motifs = motifs_from(genomes, case)
+    return lambda: [index.search(motif) for motif in motifs]
+
+def stage_kmer_count(genomes, path, case):
+    seqs, ids = [seq for _, seq in genomes], [ID for ID, _ in genomes]
+    return lambda: KmerCounter(seqs, ids, case.get("k", 8))
+
+def stage_minhash_sketch(genomes, path, case):
+    seqs = [np.frombuffer(seq.encode("ascii"), dtype=np.uint8) for _, seq in genomes]
+    return lambda: [sketchHashes(seq) for seq in seqs]
+
+def stage_minhash_rank(genomes, path, case):
+    sketches = [sketchHashes(np.frombuffer(seq.encode("ascii"), dtype=np.uint8)) for _, seq in genomes]
+    collection = SketchCollection(sketches, [ID for ID, _ in genomes])
+    return lambda: collection.rank(sketches[0], top_n=10)
+
+def stage_global_alignment(genomes, path, case):
+    A, B = genomes[0][1], genomes[1][1]
+    return lambda: globalAlignment(A, B, -2, 1, -1)
+
+def stage_local_alignment(genomes, path, case):
+    A, B = genomes[0][1], genomes[1][1]
+    return lambda: localAlignment(A, B, -2, 1, -1)
+
+def stage_edit_distance(genomes, path, case):
+    A, B = genomes[0][1], genomes[1][1]
+    return lambda: editDistance(A, B)
+
+def stage_global_alignment_numpy(genomes, path, case):
+    A, B = genomes[0][1], genomes[1][1]
+    def run():
+        SequenceAlignment.clear_cache()
+        return SequenceAlignment(A, B).align_sequences(algo="global")
+    return run
+
+def stage_compare_to_reference(genomes, path, case):
+    reference, *targets = [MitochondrialDNA(seq, ID) for ID, seq in genomes]
+    def run():
+        SequenceAlignment.clear_cache()
+        return compare_to_reference(reference, targets)
+    return run
+
+def stage_all_vs_all(genomes, path, case):
+    targets = [MitochondrialDNA(seq, ID) for ID, seq in genomes]
+    def run():
+        SequenceAlignment.clear_cache()
+        return all_vs_all(targets, "edit_distance", workers=1)
+    return run
+
+def stage_seed_extend(genomes, path, case):
+    # A 1,000 bp fragment of the first genome searched against the whole collection
+    seqs = [seq for _, seq in genomes]
+    index = CollectionFMIndex(seqs, [ID for ID, _ in genomes])
+    start = len(seqs[0]) // 3
+    query = seqs[0][start:start+1000]
+    return lambda: seedAndExtend(index, seqs, query)
+
+def motifs_from(genomes, case, count:int = 20, size:int = 8):
+    # Motifs sampled from the first genome, so most of them occur
+    rng = np.random.default_rng(case["seed"])
+    seq = genomes[0][1]
+    starts = rng.integers(0, max(1, len(seq) - size), count)
+    return [seq[start:start+size] for start in starts]
+
+STAGES = {
+    "parse": stage_parse,
+    "parse_dataframe": stage_parse_dataframe,
+    "bwt": stage_bwt,
+    "fm_index_build": stage_fm_index_build,
+    "fm_query": stage_fm_query,
+    "fm_locate": stage_fm_locate,
+    "collection_index_build": stage_collection_index_build,
+    "collection_search": stage_collection_search,
+    "seed_extend": stage_seed_extend,
+    "kmer_count": stage_kmer_count,
+    "minhash_sketch": stage_minhash_sketch,
+    "minhash_rank": stage_minhash_rank,
+    "global_alignment": stage_global_alignment,
+    "local_alignment": stage_local_alignment,
+    "global_alignment_numpy": stage_global_alignment_numpy,
+    "edit_distance": stage_edit_distance,
+    "compare_to_reference": stage_compare_to_reference,
+    "all_vs_all": stage_all_vs_all,
+}
+
+# Cases per profile: stage -> list of (count, length), optionally with stage parameters ({"k": ...}), and a shared divergence. The cell-by-cell Python alignments
+# are kept to short genomes, the collection-wide stages go up to 10,000 genomes in the full profile
+PROFILES = {
+    "quick": {
+        "parse": [(100, 1000)],
+        "parse_dataframe": [(100, 1000)],
+        "bwt": [(1, 1000), (1, 16500)],
+        "fm_index_build": [(1, 16500)],
+        "fm_query": [(1, 16500)],
+        "fm_locate": [(1, 16500)],
+        "collection_index_build": [(100, 1000)],
+        "collection_search": [(100, 1000)],
+        "seed_extend": [(10, 16500)],
+        "kmer_count": [(100, 1000)] + [(100, 16500, {"k": k}) for k in range(8, 13)],
+        "minhash_sketch": [(100, 16500)],
+        "minhash_rank": [(1000, 16500)],
+        "global_alignment": [(2, 500)],
+        "local_alignment": [(2, 500)],
+        "global_alignment_numpy": [(2, 1000)],
+        "edit_distance": [(2, 500), (2, 16500)],
+        "compare_to_reference": [(10, 1000)],
+        "all_vs_all": [(20, 1000)],
+    },
+    "full": {
+        "parse": [(10, 16500), (1000, 16500), (10000, 16500)],
+        "parse_dataframe": [(10, 16500), (1000, 16500)],
+        "bwt": [(1, 1000), (1, 4000), (1, 16500)],
+        "fm_index_build": [(1, 1000), (1, 4000), (1, 16500)],
+        "fm_query": [(1, 1000), (1, 16500)],
+        "fm_locate": [(1, 16500)],
+        "collection_index_build": [(10, 16500), (1000, 16500)],
+        "collection_search": [(10, 16500), (1000, 16500)],
+        "seed_extend": [(10, 16500), (100, 16500)],
+        "kmer_count": [(10, 16500), (1000, 16500), (10000, 1000)] + [(1000, 16500, {"k": k}) for k in range(8, 13)],
+        "minhash_sketch": [(1000, 16500)],
+        "minhash_rank": [(1000, 16500), (10000, 16500)],
+        "global_alignment": [(2, 1000), (2, 2000)],
+        "local_alignment": [(2, 1000), (2, 2000)],
+        "global_alignment_numpy": [(2, 1000), (2, 4000), (2, 16500)],
+        "edit_distance": [(2, 1000), (2, 2000), (2, 16500)],
+        "compare_to_reference": [(10, 1000), (10, 4000)],
+        "all_vs_all": [(20, 1000), (20, 16500)],
+    },
+}
+
+CASE_PARAMS = ("k",)                                                  # stage parameters a case may set, part of its key
+
+def case_key(result):
+    params = "".join(f"|{name}={result[name]}" for name in CASE_PARAMS if name in result)
+    return f"{result['stage']}|{result['count']}x{result['length']}{params}|d={result['divergence']}|seed={result['seed']}"
+
+def run_benchmarks(profile:str, stages:list, seed:int, divergence:float, repeat:int, log=sys.stderr):
+    """Run every case of the profile for the selected stages and return one result dict per case."""
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for stage in stages:
+            for count, length, *params in PROFILES[profile][stage]:
+                case = {"stage": stage, "count": count, "length": length, **(params[0] if params else {}), "divergence": divergence, "seed": seed}
+                genomes = generate_genomes(count, length, divergence, seed)
+                path = os.path.join(folder, f"{count}x{length}.fasta")
+                if not os.path.exists(path):
+                    write_fasta(genomes, path)
+                func = STAGES[stage](genomes, path, case)
+                case.update(measure(func, repeat))
+                results.append(case)
+                print(f"{case_key(case):<60} {case['seconds']:>10.4f} s {case['peak_bytes'] / 2**20:>10.1f} MB", file=log)
+    return results
+
+def compare_results(results, baseline, threshold:float, min_seconds:float = 0.005):
+    """
+    Cases slower, or with a higher peak allocation, than the baseline by more than the threshold ratio.
+    Cases under min_seconds in both runs are compared on memory only, their timings being mostly noise.
+    """
+    previous = {case_key(case): case for case in baseline["results"]}
+    regressions = []
+    for case in results:
+        old = previous.get(case_key(case))
+        if old is None:
+            continue
+        time_ratio = case["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        memory_ratio = case["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else 1.0
+        slower = time_ratio > threshold and max(case["seconds"], old["seconds"]) >= min_seconds
+        if slower or memory_ratio > threshold:
+            regressions.append({"case": case_key(case), "time_ratio": round(time_ratio, 3), "memory_ratio": round(memory_ratio, 3)})
+    return regressions
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description="Benchmark parsing, indexing, searching and alignment on seeded synthetic genomes.")
+    argument_parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    argument_parser.add_argument("--stages", help=f"comma-separated subset of: {', '.join(STAGES)}")
+    argument_parser.add_argument("--seed", type=int, default=42)
+    argument_parser.add_argument("--divergence", type=float, default=0.02, help="fraction of substituted positions per genome")
+    argument_parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, the best one is reported")
+    argument_parser.add_argument("--output", help="write the results as JSON to this file instead of stdout")
+    argument_parser.add_argument("--compare", help="baseline JSON file to check the results against")
+    argument_parser.add_argument("--threshold", type=float, default=1.25, help="ratio to the baseline above which a case is a regression")
+    args = argument_parser.parse_args(argv)
+
+    stages = args.stages.split(",") if args.stages else list(STAGES)
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        argument_parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    report = {
+        "meta": {
+            "profile": args.profile,
+            "seed": args.seed,
+            "divergence": args.divergence,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": run_benchmarks(args.profile, stages, args.seed, args.divergence, args.repeat),
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report["regressions"] = compare_results(report["results"], baseline, args.threshold)
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['case']}: time x{regression['time_ratio']}, memory x{regression['memory_ratio']}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(report, out, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 1 if report.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Command-line batch runner: genome statistics, motif search, pairwise alignment, reference comparison, all-vs-all
+matrix and fragment search over a FASTA file, without the web app.
+
+    python cli.py stats genomes.fasta --window 500 --step 100
+    python cli.py motif genomes.fasta GATC --max-mismatches 1 --format ndjson
+    python cli.py align genomes.fasta NC_000001 NC_000002
+    python cli.py reference genomes.fasta NC_000001 --metric edit_distance --top-n 10
+    python cli.py matrix genomes.fasta --store uploads/matrices
+    python cli.py search genomes.fasta --query ACGT...
+
+Genomes are read one record at a time and results are written to stdout as they are computed, one line each (TSV
+with a header, or NDJSON), so output can be piped while a long run goes on. Per-genome work runs in a process pool.
+The analysis modules (numpy, and pandas or matplotlib where used) are only imported by the subcommand that needs them,
+so --help and argument errors return at once.
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import deque
+
+# Sequences and parameters shipped to each worker once, by the pool initializer
+_worker_state = {}
+
+class RecordWriter:
+    """Writes result records (dicts) to a stream as TSV (header from the first record) or NDJSON, one line per record."""
+
+    def __init__(self, stream, format:str = "tsv"):
+        self.stream = stream
+        self.format = format
+        self.columns = None
+
+    def write(self, record:dict):
+        if self.format == "ndjson":
+            self.stream.write(json.dumps(record) + "\n")
+        else:
+            if self.columns is None:
+                self.columns = list(record)
+                self.stream.write("\t".join(self.columns) + "\n")
+            self.stream.write("\t".join(tsv_value(record.get(column)) for column in self.columns) + "\n")
+        self.stream.flush()
+
+def tsv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    if isinstance(value, (list, tuple)):
+        return ",".join(tsv_value(item) for item in value)
+    return str(value)
+
+def read_records(path:str):
+    """(ID, description, seq) of each FASTA record, streamed."""
+    from parser import read_fasta
+    found = False
+    for record in read_fasta(path):
+        found = True
+        yield record
+    if not found:
+        raise ValueError(f"No valid records found in file: {path}")
+
+def find_records(path:str, ids):
+    """Records with the given IDs, reading the file only until all of them are found."""
+    wanted = set(ids)
+    found = {}
+    for ID, description, seq in read_records(path):
+        if ID in wanted and ID not in found:
+            found[ID] = (ID, description, seq)
+            if len(found) == len(wanted):
+                break
+    missing = [ID for ID in ids if ID not in found]
+    if missing:
+        raise KeyError(f"Genome(s) not found in {path}: {', '.join(missing)}")
+    return [found[ID] for ID in ids]
+
+def load_genomes(path:str):
+    from models import MitochondrialDNA
+    return [MitochondrialDNA(seq, ID, description) for ID, description, seq in read_records(path)]
+
+def imap_ordered(func, items, workers:int, initializer=None, initargs=()):
+    """
+    func over items in a process pool, results yielded in input order as soon as available. At most a few tasks per
+    worker are in flight, so items can be a stream (e.g. genomes read from a file) and memory stays bounded.
+    """
+    if workers <= 1:
+        if initializer:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # also reached when the consumer stops early (closed pipe, Ctrl-C): drop what is still queued
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def init_worker(state:dict):
+    _worker_state.clear()
+    _worker_state.update(state)
+
+def genome_stats(record):
+    from models import MitochondrialDNA
+    ID, description, seq = record
+    genome = MitochondrialDNA(seq, ID, description)
+    window, step = _worker_state["window"], _worker_state["step"]
+    gc = genome.get_window_profile(window, step, "gc")[1]
+    skew = genome.get_window_profile(window, step, "gc_skew")[1]
+    return {
+        "id": ID,
+        "length": genome.get_length(),
+        "gc_content": genome.get_GC_content(),
+        "window_gc_min": float(gc.min()) if len(gc) else None,
+        "window_gc_max": float(gc.max()) if len(gc) else None,
+        "gc_skew_min": float(skew.min()) if len(skew) else None,
+        "gc_skew_max": float(skew.max()) if len(skew) else None,
+        "description": description,
+    }
+
+def genome_motifs(record):
+    from models import MitochondrialDNA, MotifFinder
+    ID, description, seq = record
+    motif, max_mismatches, max_edits = _worker_state["motif"], _worker_state["max_mismatches"], _worker_state["max_edits"]
+    hits = MotifFinder(motif).search_motif(MitochondrialDNA(seq, ID, description), max_mismatches, max_edits)
+    result = {"id": ID, "motif": motif, "count": len(hits)}
+    if max_mismatches or max_edits:
+        result["positions"] = [int(offset) for offset, _ in hits]
+        result["distances"] = [int(distance) for _, distance in hits]
+    else:
+        result["positions"] = [int(offset) for offset in hits]
+    return result
+
+def reference_pair(record):
+    from models import SequenceAlignment
+    from part3 import pair_similarity
+    ID, _, seq = record
+    score, similarity, distance = pair_similarity(SequenceAlignment(_worker_state["reference"], seq), _worker_state["metric"], **_worker_state["scoring"])
+    return {"id": ID, "score": score, "similarity": similarity, "edit_distance": distance}
+
+def command_stats(args, writer):
+    if args.window < 1 or args.step < 1:
+        raise ValueError("Window and step must be at least 1")
+    for result in imap_ordered(genome_stats, read_records(args.fasta), args.workers, init_worker, ({"window": args.window, "step": args.step},)):
+        writer.write(result)
+
+def command_motif(args, writer):
+    state = {"motif": args.motif.upper(), "max_mismatches": args.max_mismatches, "max_edits": args.max_edits}
+    for result in imap_ordered(genome_motifs, read_records(args.fasta), args.workers, init_worker, (state,)):
+        writer.write(result)
+
+def command_align(args, writer):
+    from models import SequenceAlignment
+    (id1, _, seq1), (id2, _, seq2) = find_records(args.fasta, [args.id1, args.id2])
+    alignment = SequenceAlignment(seq1, seq2).align_sequences(args.gap_pen, args.match, args.mismatch, algo=args.algo)
+    writer.write({
+        "id1": id1,
+        "id2": id2,
+        "score": alignment.score,
+        "identity": alignment.identity,
+        "matches": alignment.matches,
+        "mismatches": alignment.mismatches,
+        "gaps": alignment.gaps,
+        "start1": alignment.start1,
+        "end1": alignment.end1,
+        "start2": alignment.start2,
+        "end2": alignment.end2,
+        "cigar": alignment.cigar,
+    })
+
+def command_reference(args, writer):
+    from part3 import check_metric
+    check_metric(args.metric)
+    reference_id, _, reference = find_records(args.fasta, [args.reference_id])[0]
+    estimates = None
+    if args.top_n is not None or args.min_similarity is not None:
+        # Ranking needs every sketch, so the file is read once more for them; only the selected targets are compared
+        from minhash_sketch import SketchCollection, sketchHashes
+        import numpy as np
+        ids, sketches = [], []
+        for ID, _, seq in read_records(args.fasta):
+            if ID != reference_id:
+                ids.append(ID)
+                sketches.append(sketchHashes(np.frombuffer(seq.encode("ascii"), dtype=np.uint8)))
+        collection = SketchCollection(sketches, ids)
+        ranked = collection.rank(sketchHashes(np.frombuffer(reference.encode("ascii"), dtype=np.uint8)), args.top_n, args.min_similarity)
+        estimates = dict(ranked)
+    targets = (record for record in read_records(args.fasta)
+               if record[0] != reference_id and (estimates is None or record[0] in estimates))
+    state = {"reference": reference, "metric": args.metric, "scoring": scoring(args)}
+    for result in imap_ordered(reference_pair, targets, args.workers, init_worker, (state,)):
+        result["estimated_similarity"] = estimates.get(result["id"]) if estimates else None
+        writer.write(result)
+
+def command_matrix(args, writer):
+    from distance_matrix import all_vs_all
+    genomes = load_genomes(args.fasta)
+    value_name = "edit_distance" if args.metric == "edit_distance" else "score"
+
+    def write_row(i, similarity, values):
+        # Rows come in genome order as they are computed (stored ones at once), not after the whole matrix
+        for j in range(i):
+            writer.write({"id1": genomes[i].ID, "id2": genomes[j].ID, "similarity": float(similarity[j]), value_name: int(values[j])})
+
+    all_vs_all(genomes, args.metric, folder=args.store, workers=args.workers, on_row=write_row, **scoring(args))
+
+def command_search(args, writer):
+    from part3 import search_fragment
+    if args.query_file:
+        query = next(read_records(args.query_file))[2]
+    else:
+        query = args.query
+    genomes = load_genomes(args.fasta)
+    for hit in search_fragment(genomes, query, top_n=args.top_n, gap_pen=args.gap_pen, match=args.match, mismatch=args.mismatch):
+        hit.pop("alignment")
+        writer.write(hit)
+
+def scoring(args):
+    return {"gap_pen": args.gap_pen, "match": args.match, "mismatch": args.mismatch}
+
+def add_scoring(parser):
+    parser.add_argument("--gap-pen", type=int, default=-2, help="gap penalty (default -2)")
+    parser.add_argument("--match", type=int, default=1, help="match score (default 1)")
+    parser.add_argument("--mismatch", type=int, default=-1, help="mismatch score (default -1)")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch analyses of mitochondrial genomes from a FASTA file, written to stdout as they complete.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("fasta", help="FASTA file of genomes")
+    common.add_argument("--format", choices=("tsv", "ndjson"), default="tsv", help="output format (default tsv)")
+    common.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: number of CPUs)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats = commands.add_parser("stats", parents=[common], help="length, GC content and windowed GC / GC skew ranges of each genome")
+    stats.add_argument("--window", type=int, default=500, help="window size in bases (default 500)")
+    stats.add_argument("--step", type=int, default=100, help="distance between windows (default 100)")
+    stats.set_defaults(func=command_stats)
+
+    motif = commands.add_parser("motif", parents=[common], help="occurrences of a motif in each genome")
+    motif.add_argument("motif", help="motif to search for")
+    motif.add_argument("--max-mismatches", type=int, default=0, help="substitutions allowed in an occurrence")
+    motif.add_argument("--max-edits", type=int, default=0, help="substitutions, insertions and deletions allowed in an occurrence")
+    motif.set_defaults(func=command_motif)
+
+    align = commands.add_parser("align", parents=[common], help="align two genomes of the file")
+    align.add_argument("id1")
+    align.add_argument("id2")
+    align.add_argument("--algo", choices=("global", "local"), default="global")
+    add_scoring(align)
+    align.set_defaults(func=command_align)
+
+    reference = commands.add_parser("reference", parents=[common], help="compare every genome to a reference genome")
+    reference.add_argument("reference_id", help="ID of the reference genome")
+    reference.add_argument("--metric", choices=("alignment", "edit_distance"), default="alignment")
+    reference.add_argument("--top-n", type=int, help="only compare the N genomes closest to the reference by MinHash sketch")
+    reference.add_argument("--min-similarity", type=float, help="only compare genomes with an estimated identity of at least this (%%)")
+    add_scoring(reference)
+    reference.set_defaults(func=command_reference)
+
+    matrix = commands.add_parser("matrix", parents=[common], help="all-vs-all comparison, one line per pair")
+    matrix.add_argument("--metric", choices=("alignment", "edit_distance"), default="edit_distance")
+    matrix.add_argument("--store", help="folder keeping computed pairs between runs (e.g. uploads/matrices)")
+    add_scoring(matrix)
+    matrix.set_defaults(func=command_matrix)
+
+    search = commands.add_parser("search", parents=[common], help="local hits of a fragment in every genome (seed and extend)")
+    query = search.add_mutually_exclusive_group(required=True)
+    query.add_argument("--query", help="fragment sequence")
+    query.add_argument("--query-file", help="FASTA file whose first record is the fragment")
+    search.add_argument("--top-n", type=int, help="number of hits to write (default: all)")
+    add_scoring(search)
+    search.set_defaults(func=command_search)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.workers = max(args.workers, 1)
+    writer = RecordWriter(sys.stdout, args.format)
+    try:
+        args.func(args, writer)
+    except BrokenPipeError:
+        # the reader went away (e.g. piped into head): stop quietly, pointing stdout at devnull so the exit flush cannot fail
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        print(f"error: {e.args[0] if e.args else e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# Sliding-window base composition from prefix sums: counts[i] holds the number of A, C, G and T among the first i
+# bases, so any window [s, e) is counts[e] - counts[s] whatever its length, and all windows are one vectorized gather.
+
+import numpy as np
+
+BASES = "ACGT"
+BASE_INDEX = np.full(256, -1, dtype=np.int8)                          # byte -> column of the counts, -1 for other symbols
+for column, base in enumerate(BASES):
+    BASE_INDEX[ord(base)] = column
+    BASE_INDEX[ord(base.lower())] = column
+PROFILES = ("gc", "gc_skew", "at_skew")
+
+def prefixCounts(codes):
+    # (n+1) x 4 cumulative counts of A, C, G, T over a sequence of ASCII bases
+    columns = BASE_INDEX[codes]
+    counts = np.zeros((len(codes) + 1, len(BASES)), dtype=np.int32)
+    for column in range(len(BASES)):
+        np.cumsum(columns == column, out=counts[1:, column])
+    return counts
+
+def windowStarts(length, window, step):
+    # Start of every full window; a sequence shorter than the window has none
+    if window < 1 or step < 1:
+        raise ValueError("window and step must be positive")
+    return np.arange(0, length - window + 1, step)
+
+def windowCounts(counts, starts, window):
+    # Base counts of the windows [start, start + window), one row per window
+    return counts[starts + window] - counts[starts]
+
+def profileValues(counts, window, kind):
+    # GC content (%) of each window, or its GC skew (G-C)/(G+C) or AT skew (A-T)/(A+T), 0 where no such base occurs
+    a, c, g, t = (counts[:, column].astype(np.float64) for column in range(len(BASES)))
+    if kind == "gc":
+        return (g + c) / window * 100
+    if kind == "gc_skew":
+        first, second = g, c
+    elif kind == "at_skew":
+        first, second = a, t
+    else:
+        raise ValueError(f"Unknown profile: {kind}, expected one of {', '.join(PROFILES)}")
+    total = first + second
+    return np.divide(first - second, total, out=np.zeros_like(total), where=total > 0)
+
+class CollectionProfile:
+    """Prefix counts of a whole genome collection in one array, so a window profile of every genome is one gather."""
+
+    def __init__(self, sequences, ids):
+        '''
+        :param sequences: sequences as strings or uint8 arrays of ASCII bases
+        :param ids: one identifier per sequence
+        '''
+        self.ids = list(ids)
+        parts = [seq if isinstance(seq, np.ndarray) else np.frombuffer(seq.encode("ascii"), dtype=np.uint8) for seq in sequences]
+        self.lengths = np.array([len(part) for part in parts], dtype=np.int64)
+        # Genome g owns rows offsets[g] .. offsets[g] + lengths[g] of counts (its n+1 prefix rows)
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths + 1)[:-1])).astype(np.int64)
+        self.counts = np.concatenate([prefixCounts(part) for part in parts]) if parts else np.zeros((0, len(BASES)), dtype=np.int32)
+
+    def windows(self, window, step):
+        # Rows of every genome's window starts in counts, and how many windows each genome has
+        if window < 1 or step < 1:
+            raise ValueError("window and step must be positive")
+        per_genome = np.maximum((self.lengths - window) // step + 1, 0)
+        genome = np.repeat(np.arange(len(self.lengths)), per_genome)
+        first = np.concatenate(([0], np.cumsum(per_genome)[:-1]))
+        starts = (np.arange(len(genome)) - first[genome]) * step
+        return self.offsets[genome] + starts, per_genome
+
+    def profiles(self, window, step, kind="gc"):
+        """Window starts and profile values of every genome, keyed by ID."""
+        rows, per_genome = self.windows(window, step)
+        values = profileValues(windowCounts(self.counts, rows, window), window, kind)
+        bounds = np.concatenate(([0], np.cumsum(per_genome)))
+        return {ID: (np.arange(per_genome[g]) * step, values[bounds[g]:bounds[g+1]]) for g, ID in enumerate(self.ids)}
+
+    def summary(self, window, step, kind="gc"):
+        """Minimum, mean and maximum of the profile of each genome (None for genomes shorter than the window)."""
+        result = {}
+        for ID, (_, values) in self.profiles(window, step, kind).items():
+            result[ID] = (float(values.min()), float(values.mean()), float(values.max())) if len(values) else None
+        return result
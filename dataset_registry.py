@@ -0,0 +1,140 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from genome_store import open_store
+from fm_index_query import FMIndex, CollectionFMIndex
+from kmer_counter import KmerCounter
+from composition_profile import CollectionProfile
+from minhash_sketch import SketchCollection, DEFAULT_K, DEFAULT_SCALED
+
+INDEX_SUFFIX = ".fmi"
+
+def estimate_size(value):
+    """Rough number of bytes held by a derived result (arrays, FM-indexes and containers of them)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, FMIndex):
+        return len(value.L) + value.occ.nbytes + 64 * len(value.sampled)
+    if isinstance(value, CollectionFMIndex):
+        # memory-mapped arrays live in the page cache, not in the process
+        return sum(estimate_size(getattr(value, name)) for name in value.ARRAYS if not isinstance(getattr(value, name), np.memmap))
+    if isinstance(value, (KmerCounter, CollectionProfile, SketchCollection)):
+        return estimate_size(vars(value))
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 64
+
+class Dataset:
+    """Genomes of one uploaded FASTA file plus the results derived from them (indexes, counts, ...)."""
+
+    def __init__(self, dataset_id:str, fasta_path:str):
+        self.id = dataset_id
+        self.fasta_path = fasta_path
+        self.store = open_store(fasta_path)
+        self.genomes = list(self.store)
+        self.derived = {}
+        self.lock = threading.RLock()
+
+    def get_genome(self, ID:str):
+        return self.store.get(ID) if ID in self.store else None
+
+    def get_derived(self, key, build):
+        """Derived result for key, built once by build(dataset) while holding the dataset's lock."""
+        with self.lock:
+            if key not in self.derived:
+                self.derived[key] = build(self)
+            return self.derived[key]
+
+    def get_collection_index(self):
+        """FM-index over all genomes of the dataset, saved next to the FASTA file and memory-mapped by every process."""
+        def build(dataset):
+            index_path = dataset.fasta_path + INDEX_SUFFIX
+            if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(dataset.fasta_path):
+                CollectionFMIndex([g.codes for g in dataset.genomes], [g.ID for g in dataset.genomes]).save(index_path)
+            return CollectionFMIndex.load(index_path)
+        return self.get_derived('collection_index', build)
+
+    def get_kmer_counter(self, k:int):
+        """K-mer counts of all genomes of the dataset, computed once per k."""
+        return self.get_derived(('kmers', k), lambda dataset: KmerCounter([g.codes for g in dataset.genomes], [g.ID for g in dataset.genomes], k))
+
+    def get_sketches(self, k:int = DEFAULT_K, scaled:int = DEFAULT_SCALED):
+        """MinHash sketches of all genomes of the dataset (each also kept on its genome), computed once per k and scaled."""
+        def build(dataset):
+            return SketchCollection([g.get_sketch(k, scaled) for g in dataset.genomes], [g.ID for g in dataset.genomes], k, scaled)
+        return self.get_derived(('sketches', k, scaled), build)
+
+    def memory_size(self):
+        size = sum(genome.get_length() for genome in self.genomes)
+        size += sum(estimate_size(genome.fm_index) for genome in self.genomes if genome.fm_index is not None)
+        size += sum(estimate_size(genome.sketch[2]) for genome in self.genomes if genome.sketch is not None)
+        size += sum(estimate_size(value) for value in list(self.derived.values()))
+        return size
+
+class DatasetRegistry:
+    """
+    Uploaded datasets keyed by the SHA-256 of their content: re-uploading a file is a cache hit, and the
+    dataset ID can be sent back by later requests instead of the file. Files live on disk, so every worker
+    process resolves the same IDs; parsed genomes and derived results are kept in memory under a budget,
+    least recently used datasets being dropped first.
+    """
+
+    def __init__(self, folder:str, memory_budget:int = 512 * 1024 * 1024):
+        self.folder = folder
+        self.memory_budget = memory_budget
+        self.datasets = OrderedDict()
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def fasta_path(self, dataset_id:str):
+        return os.path.join(self.folder, f"{dataset_id}.fasta")
+
+    def add_upload(self, file):
+        """Store an uploaded FASTA file (a file-like object or bytes) under its content hash and return the dataset ID."""
+        content = file if isinstance(file, bytes) else file.read()
+        dataset_id = hashlib.sha256(content).hexdigest()[:16]
+        path = self.fasta_path(dataset_id)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as out:
+                out.write(content)
+            os.replace(tmp_path, path)
+        return dataset_id
+
+    def add_file(self, fasta_path:str):
+        """Register a FASTA file already on disk and return its dataset ID."""
+        with open(fasta_path, "rb") as f:
+            return self.add_upload(f)
+
+    def get(self, dataset_id:str):
+        """Dataset for an ID, loaded from disk on a miss; raises KeyError for an unknown ID."""
+        with self.lock:
+            if dataset_id in self.datasets:
+                self.datasets.move_to_end(dataset_id)
+                dataset = self.datasets[dataset_id]
+            else:
+                path = self.fasta_path(dataset_id)
+                if not dataset_id.isalnum() or not os.path.exists(path):
+                    raise KeyError(f"Unknown dataset: {dataset_id}")
+                dataset = Dataset(dataset_id, path)
+                self.datasets[dataset_id] = dataset
+            self.evict(keep=dataset_id)
+            return dataset
+
+    def evict(self, keep:str = None):
+        # Drop least recently used datasets until the in-memory total fits the budget (never the one being served)
+        sizes = {dataset_id: dataset.memory_size() for dataset_id, dataset in self.datasets.items()}
+        total = sum(sizes.values())
+        for dataset_id in list(self.datasets):
+            if total <= self.memory_budget:
+                break
+            if dataset_id == keep:
+                continue
+            del self.datasets[dataset_id]
+            total -= sizes[dataset_id]
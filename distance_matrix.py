@@ -0,0 +1,298 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import uuid
+import numpy as np
+from models import SequenceAlignment, sequence_hash
+from part3 import pair_similarity, check_metric
+from metrics import timed
+from worker_pool import run_tasks
+
+# All-vs-all comparison results, persisted per metric and scoring. A store holds the similarity (%) and the score or
+# edit distance of every pair of its sequences as condensed lower-triangle arrays: pair (i, j), j < i, sits at
+# i*(i-1)/2 + j, so the pairs of a new sequence form a new row appended at the end. Rows are identified by sequence
+# hash, so a dataset that grows (or is re-uploaded in another order) only costs the rows of its new sequences.
+
+SCORING = {"gap_pen": -2, "match": 1, "mismatch": -1}
+HASH_SIZE = 16                                                        # bytes of sequence_hash
+_folder_locks = {}
+_folder_locks_lock = threading.Lock()
+
+def condensed_index(i, j):
+    """Position of pair (i, j) in a condensed array (i != j, either order)."""
+    high, low = np.maximum(i, j), np.minimum(i, j)
+    return high * (high - 1) // 2 + low
+
+def matrix_key(metric:str, scoring:dict):
+    """Folder name for a metric and its scoring; the edit distance does not depend on the scoring."""
+    params = {"metric": metric} if metric == "edit_distance" else {"metric": metric, **scoring}
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+    return f"{metric}-{digest}"
+
+def folder_lock(folder:str):
+    with _folder_locks_lock:
+        return _folder_locks.setdefault(folder, threading.Lock())
+
+class PairwiseStore:
+    """Pairwise results of a set of sequences (rows, by hash) for one metric and scoring, saved as one .npz file."""
+
+    def __init__(self, path:str = None, hashes=(), similarity=None, values=None):
+        self.path = path
+        self.hashes = list(hashes)
+        self.rows = {h: row for row, h in enumerate(self.hashes)}
+        self.similarity = np.zeros(0, dtype=np.float32) if similarity is None else similarity
+        self.values = np.zeros(0, dtype=np.int32) if values is None else values
+
+    @classmethod
+    def load(cls, path:str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File not found: {path}")
+        with np.load(path) as data:
+            hashes = [row.tobytes() for row in data["hashes"]]
+            return cls(path, hashes, data["similarity"], data["values"])
+
+    @staticmethod
+    def load_hashes(path:str):
+        # Only the row hashes, to pick a store without reading its matrix
+        with np.load(path) as data:
+            return [row.tobytes() for row in data["hashes"]]
+
+    def save(self):
+        # Written to a temporary file first, so readers never see a half-written store
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        hashes = np.frombuffer(b"".join(self.hashes), dtype=np.uint8).reshape(-1, HASH_SIZE)
+        np.savez(tmp_path, hashes=hashes, similarity=self.similarity, values=self.values)
+        os.replace(tmp_path, self.path)
+
+    def subset(self, hashes, path:str):
+        """New store of the given known rows (kept in this store's order), pairs copied without computing anything."""
+        rows = np.array(sorted(self.rows[h] for h in hashes), dtype=np.int64)
+        i, j = np.tril_indices(len(rows), -1)
+        index = condensed_index(rows[i], rows[j])
+        return PairwiseStore(path, [self.hashes[row] for row in rows], self.similarity[index], self.values[index])
+
+    def extend(self, hashes, similarity_rows, value_rows):
+        """Append rows; row k holds the pairs of hashes[k] with every row before it."""
+        self.similarity = np.concatenate([self.similarity] + similarity_rows).astype(np.float32, copy=False)
+        self.values = np.concatenate([self.values] + value_rows).astype(np.int32, copy=False)
+        for h in hashes:
+            self.rows[h] = len(self.hashes)
+            self.hashes.append(h)
+
+    def pairs(self, hashes):
+        """Condensed similarity and value arrays over the given hashes (all known, in that order), and where two hashes are equal."""
+        rows = np.array([self.rows[h] for h in hashes], dtype=np.int64)
+        i, j = np.tril_indices(len(rows), -1)
+        same = rows[i] == rows[j]
+        index = np.where(same, 0, condensed_index(rows[i], rows[j]))
+        return self.similarity[index], self.values[index], np.flatnonzero(same)
+
+class DistanceMatrix:
+    """Pairwise results over a list of genomes, as condensed lower-triangle arrays in the order of the genomes."""
+
+    def __init__(self, ids, metric:str, similarity, values):
+        self.ids = list(ids)
+        self.metric = metric
+        self.similarity = similarity                                  # similarity (%) of each pair
+        self.values = values                                          # alignment score or edit distance of each pair
+
+    def square(self, name:str = "similarity"):
+        """Full n x n matrix of similarity or values; the diagonal is 100 (similarity), 0 (edit distance) or NaN (score)."""
+        n = len(self.ids)
+        condensed = self.similarity if name == "similarity" else self.values
+        diagonal = 100.0 if name == "similarity" else 0.0 if self.metric == "edit_distance" else np.nan
+        matrix = np.full((n, n), diagonal, dtype=np.float64)
+        i, j = np.tril_indices(n, -1)
+        matrix[i, j] = condensed
+        matrix[j, i] = condensed
+        return matrix
+
+    def to_dict(self):
+        return {
+            "ids": self.ids,
+            "metric": self.metric,
+            "similarity": self.similarity.tolist(),
+            "values": self.values.tolist(),
+        }
+
+def row_pairs(seqs, row, metric, scoring):
+    """Similarity and value of sequence row against every row before it."""
+    similarity = np.empty(row, dtype=np.float32)
+    values = np.empty(row, dtype=np.int32)
+    for j in range(row):
+        score, similarity[j], distance = pair_similarity(SequenceAlignment(seqs[row], seqs[j]), metric, **scoring)
+        values[j] = distance if metric == "edit_distance" else score
+    return similarity, values
+
+class RowStream:
+    """
+    Genome rows of a matrix being computed (genome i against every genome before it), passed to on_row(i, similarity,
+    values) in genome order as soon as the store rows of their sequences are known, instead of once all are done.
+    """
+
+    def __init__(self, store, genomes, hashes, metric, scoring, on_row):
+        self.store = store
+        self.genomes = genomes
+        self.hashes = hashes
+        self.metric = metric
+        self.scoring = scoring
+        self.on_row = on_row
+        self.computed = {}  # hash -> (row, similarity, values) of rows computed but not appended to the store yet
+        self.next = 0
+
+    def add(self, h, row, similarity, values):
+        self.computed[h] = (row, similarity, values)
+        self.flush()
+
+    def row_of(self, h):
+        if h in self.computed:
+            return self.computed[h][0]
+        return self.store.rows.get(h)
+
+    def flush(self):
+        # New hashes are computed in order of first appearance, so once genome i's row is known all earlier ones are
+        while self.next < len(self.hashes) and self.row_of(self.hashes[self.next]) is not None:
+            i = self.next
+            row = self.row_of(self.hashes[i])
+            similarity = np.empty(i, dtype=np.float32)
+            values = np.empty(i, dtype=np.int32)
+            for j in range(i):
+                other = self.row_of(self.hashes[j])
+                if other == row:
+                    score, similarity[j], distance = pair_similarity(SequenceAlignment(self.genomes[i].seq, self.genomes[j].seq), self.metric, **self.scoring)
+                    values[j] = distance if self.metric == "edit_distance" else score
+                    continue
+                high, low = (self.hashes[i], other) if row > other else (self.hashes[j], row)
+                if high in self.computed:
+                    similarity[j], values[j] = self.computed[high][1][low], self.computed[high][2][low]
+                else:
+                    k = condensed_index(max(row, other), low)
+                    similarity[j], values[j] = self.store.similarity[k], self.store.values[k]
+            self.on_row(i, similarity, values)
+            self.next += 1
+
+def compute_rows(store, new_hashes, seqs, metric, scoring, workers, min_parallel, progress, stream=None):
+    """
+    Append a row per new hash to the store, saving the rows already done if interrupted (e.g. a cancelled job).
+    Each row is also handed to stream (a RowStream), if any, as soon as it and the rows before it are done.
+    """
+    first = len(store.hashes)
+    rows = range(first, first + len(new_hashes))
+    all_seqs = [seqs[h] for h in store.hashes] + [seqs[h] for h in new_hashes]
+    total = sum(rows)
+    done = 0
+    similarity_rows, value_rows = [], []
+    workers = workers or os.cpu_count() or 1
+    try:
+        if total < min_parallel or workers == 1:
+            for row in rows:
+                similarity, values = row_pairs(all_seqs, row, metric, scoring)
+                similarity_rows.append(similarity)
+                value_rows.append(values)
+                if stream:
+                    stream.add(new_hashes[row - first], row, similarity, values)
+                done += row
+                if progress:
+                    progress(done, total)
+        else:
+            # A task carries its row's sequence and those before it, as the shared pool keeps nothing between calls.
+            # Rows finish out of order: only the finished prefix is appended, the rest waits in pending
+            pending = {}
+            tasks = ((all_seqs[:row + 1], row, metric, scoring) for row in rows)
+            for number, outcome in run_tasks(row_pairs, tasks, workers):
+                pending[number] = outcome
+                done += rows[number]
+                while len(similarity_rows) in pending:
+                    similarity, values = pending.pop(len(similarity_rows))
+                    if stream:
+                        stream.add(new_hashes[len(similarity_rows)], first + len(similarity_rows), similarity, values)
+                    similarity_rows.append(similarity)
+                    value_rows.append(values)
+                if progress:
+                    progress(done, total)
+    finally:
+        if similarity_rows:
+            store.extend(new_hashes[:len(similarity_rows)], similarity_rows, value_rows)
+            if store.path:
+                store.save()
+
+def find_store(folder:str, hashes:set):
+    """
+    Store to use for a set of sequences: the largest one whose rows all belong to the set (it only needs new rows),
+    else a copy of the rows shared with the store overlapping the set most, else a new empty one.
+    """
+    contained, overlapping = [], []
+    for path in glob.glob(os.path.join(folder, "*.npz")):
+        stored = PairwiseStore.load_hashes(path)
+        shared = [h for h in stored if h in hashes]
+        if len(shared) == len(stored):
+            contained.append((len(stored), path))
+        elif len(shared) >= 2:
+            overlapping.append((len(shared), path, shared))
+    if contained:
+        return PairwiseStore.load(max(contained)[1])
+    new_path = os.path.join(folder, f"{uuid.uuid4().hex[:16]}.npz")
+    if overlapping:
+        _, path, shared = max(overlapping, key=lambda item: item[0])
+        return PairwiseStore.load(path).subset(shared, new_path)
+    return PairwiseStore(new_path)
+
+@timed("all_vs_all")
+def all_vs_all(genomes, metric:str = "edit_distance", folder:str = None, workers:int = None, min_parallel:int = 8, progress=None, on_row=None, **scoring):
+    """
+    Compare every unordered pair of genomes once, in a process pool, reusing the pairs already stored in folder.
+    :param metric: "edit_distance" or "alignment" (global alignment with the scoring: gap_pen, match, mismatch)
+    :param folder: where the stores are kept (one subfolder per metric and scoring); None to keep nothing
+    :param min_parallel: below this many pairs (or with a single worker) they are computed in this process
+    :param progress: optional callback progress(done, total) over the pairs to compute
+    :param on_row: optional callback on_row(i, similarity, values) with the pairs of genome i and every genome before
+                   it, called in genome order as soon as they are known (stored rows at once, new ones as computed)
+    :return: DistanceMatrix over the genomes, in their order
+    """
+    check_metric(metric)
+    scoring = {**SCORING, **scoring}
+    hashes = [sequence_hash(genome.seq) for genome in genomes]
+    seqs = {}
+    for h, genome in zip(hashes, genomes):
+        seqs.setdefault(h, genome.seq)
+    if folder:
+        store_folder = os.path.join(folder, matrix_key(metric, scoring))
+        os.makedirs(store_folder, exist_ok=True)
+        lock = folder_lock(store_folder)
+    else:
+        lock = threading.Lock()
+    with lock:
+        store = find_store(store_folder, set(seqs)) if folder else PairwiseStore()
+        new_hashes = [h for h in seqs if h not in store.rows]
+        stream = RowStream(store, genomes, hashes, metric, scoring, on_row) if on_row else None
+        if stream:
+            stream.flush()
+        if new_hashes:
+            compute_rows(store, new_hashes, seqs, metric, scoring, workers, min_parallel, progress, stream)
+        elif store.path and not os.path.exists(store.path):
+            store.save()
+    return matrix_from_store(store, genomes, hashes, metric, scoring)
+
+def load_matrix(genomes, metric:str = "edit_distance", folder:str = None, **scoring):
+    """Matrix of the genomes from the stored pairs alone, or None if some pairs were never computed."""
+    check_metric(metric)
+    scoring = {**SCORING, **scoring}
+    hashes = [sequence_hash(genome.seq) for genome in genomes]
+    wanted = set(hashes)
+    for path in glob.glob(os.path.join(folder, matrix_key(metric, scoring), "*.npz")):
+        if wanted.issubset(PairwiseStore.load_hashes(path)):
+            return matrix_from_store(PairwiseStore.load(path), genomes, hashes, metric, scoring)
+    return None
+
+def matrix_from_store(store, genomes, hashes, metric, scoring):
+    similarity, values, same = store.pairs(hashes)
+    if len(same):
+        # Identical sequences under two IDs share a row: their pair is not stored, compute it (cached per pair anyway)
+        i, j = np.tril_indices(len(genomes), -1)
+        similarity, values = similarity.copy(), values.copy()
+        for k in same:
+            score, similarity[k], distance = pair_similarity(SequenceAlignment(genomes[i[k]].seq, genomes[j[k]].seq), metric, **scoring)
+            values[k] = distance if metric == "edit_distance" else score
+    return DistanceMatrix([genome.ID for genome in genomes], metric, similarity, values)
@@ -0,0 +1,45 @@
+# Bit-parallel edit distance (Myers 1999, in Hyyrö's formulation): a column of the Levenshtein DP is held as two
+# bit-vectors of vertical +1/-1 deltas, one bit per base of A, and each base of B updates the whole column with a
+# handful of AND/OR/XOR/shift/add operations. The vectors are Python integers, so a column of any length is one
+# multiword operation carried out in C, and there is neither a matrix nor a traceback.
+
+import numpy as np
+
+def matchMasks(A):
+    # Bit i of masks[c] is set where A[i] == c, one packbits per distinct character
+    chars = np.array(list(A))
+    return {c: int.from_bytes(np.packbits(chars == c, bitorder="little").tobytes(), "little") for c in set(A)}
+
+def editDistance(A, B):
+    # Levenshtein distance between A and B (unit cost substitutions, insertions and deletions)
+    if len(B) > len(A):                                               # the distance is symmetric: loop over the shorter one
+        A, B = B, A
+    m = len(A)
+    if m == 0:
+        return len(B)
+    masks = matchMasks(A)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)                                               # bit of the bottom row, D[m][j]
+    Pv = full                                                         # column 0 is 0, 1, ..., m: all deltas +1
+    Mv = 0
+    distance = m
+    for c in B:
+        Eq = masks.get(c, 0)
+        Xv = Eq | Mv
+        Xh = (((Eq & Pv) + Pv) ^ Pv) | Eq
+        Ph = (Mv | ~(Xh | Pv)) & full                                 # horizontal deltas +1 ...
+        Mh = Pv & Xh                                                  # ... and -1
+        if Ph & last:
+            distance += 1
+        elif Mh & last:
+            distance -= 1
+        Ph = (Ph << 1) | 1                                            # row 0 is 0, 1, ..., n: its horizontal delta is +1
+        Mh <<= 1
+        Pv = (Mh | ~(Xv | Ph)) & full
+        Mv = Ph & Xv
+    return distance
+
+def editIdentity(distance, m, n):
+    # Identity (%) derived from the edit distance: an alignment has at least max(m, n) columns and at most distance of them differ
+    longest = max(m, n)
+    return (1 - distance / longest) * 100 if longest else 0
@@ -1,37 +1,339 @@
 # Burrows-Wheeler algorythm implemented for string matching through FM indexing
 
+import os
+import shutil
+import numpy as np
+
+def toCodePoints(T):
+    # Characters as an integer array that sorts exactly like the characters of the string (ASCII fast path)
+    try:
+        return np.frombuffer(T.encode("ascii"), dtype=np.uint8)
+    except UnicodeEncodeError:
+        return np.frombuffer(T.encode("utf-32-le"), dtype=np.uint32)
+
+def suffixArray(T):
+    # Prefix doubling: after round k every suffix is ranked by its first 2k characters, so at most log2(n) sorting rounds are needed
+    n = len(T)
+    rank = (T if isinstance(T, np.ndarray) else toCodePoints(T)).astype(np.int64)
+    sa = np.argsort(rank, kind="stable")
+    k = 1
+    while k < n:
+        second = np.full(n, -1, dtype=np.int64)               # rank of the suffix k characters further on, -1 past the end of T
+        second[:n-k] = rank[k:]
+        sa = np.lexsort((second, rank))
+        first_sorted, second_sorted = rank[sa], second[sa]
+        new_group = (first_sorted[1:] != first_sorted[:-1]) | (second_sorted[1:] != second_sorted[:-1])
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = np.concatenate(([0], np.cumsum(new_group)))
+        if rank[sa[-1]] == n - 1:                              # every suffix has its own rank, the order is final
+            break
+        k *= 2
+    return sa
+
 def BWT(T, DoReturnOffsets=False):
     # Initialize by adding an end character if it isn't already there
     if T[-1] != "$":
         T += "$"
-    n = len(T)
-    rotations = sorted(range(n), key=lambda i: T[i:]+T[:i]) # Store the starting index of each rotation, used later to find the offset of a query match
-    L = "".join(T[i-1 % n] for i in rotations) # All values of i-1 are less than the total length n, so the modulo returns i-1, except for -1 which returns n-1, effectively looping around to the last character $ when i=0
+    rotations = suffixArray(T) # With a unique smallest end character, sorting the suffixes gives the same order as sorting the rotations
+    L = "".join(T[i-1] for i in rotations) # T[-1] is the end character $, effectively looping around when i=0
     if DoReturnOffsets:
-        return L, rotations
+        return L, rotations.tolist()
     else:
         return L
 
+def differenceBudget(P, max_mismatches, max_edits):
+    # Differences allowed and whether they may be indels. As many differences as P has characters would match P at
+    # every position of the text (and let the backtracking try every path), so fewer are required
+    if max_mismatches < 0 or max_edits < 0:
+        raise ValueError("max_mismatches and max_edits must not be negative")
+    if max_mismatches and max_edits:
+        raise ValueError("Give either max_mismatches or max_edits, not both")
+    max_diffs = max(max_mismatches, max_edits)
+    if max_diffs >= len(P):
+        raise ValueError(f"Allowed differences ({max_diffs}) must be fewer than the pattern's length ({len(P)})")
+    return (max_edits, True) if max_edits else (max_mismatches, False)
+
+def lowerBounds(index, P):
+    # D[i] is a lower bound on the differences needed to match P[:i]: P[:i] is cut, left to right, into pieces that
+    # do not occur in the text, and each of them must contain at least one difference
+    D = [0] * (len(P) + 1)
+    differences, start = 0, 0
+    for i in range(1, len(P) + 1):
+        if index.interval(P[start:i]) == (0, 0):
+            differences += 1
+            start = i
+        D[i] = differences
+    return D
+
+def approximateIntervals(index, P, max_diffs, indels):
+    # Bounded backtracking over backward-search intervals: P is matched from its last character to its first, trying
+    # every symbol at each step (a substitution when it differs from P) and, with indels, skipping a character of P
+    # (deletion) or consuming an extra text symbol (insertion). Branches whose differences plus the lower bound of the
+    # remaining prefix exceed max_diffs are pruned. Indels are not tried at the ends of P, where they only shift a hit.
+    # Returns (top, bottom, differences) for every interval that matches all of P
+    D = lowerBounds(index, P)
+    if D[len(P)] > max_diffs:
+        return []
+    symbols = index.searchSymbols()
+    hits = []
+    best = {}                                                         # (remaining, top, bottom) -> fewest differences seen
+    stack = [(len(P), 0, len(index), 0)]
+    while stack:
+        i, top, bottom, d = stack.pop()
+        if d + D[i] > max_diffs:
+            continue
+        if best.get((i, top, bottom), max_diffs + 1) <= d:
+            continue
+        best[(i, top, bottom)] = d
+        if i == 0:
+            hits.append((top, bottom, d))
+            continue
+        if indels and 1 < i < len(P):
+            stack.append((i - 1, top, bottom, d + 1))                 # P[i-1] deleted
+        for c in symbols:
+            new_top, new_bottom = index.extend(top, bottom, c)
+            if new_top >= new_bottom:
+                continue
+            stack.append((i - 1, new_top, new_bottom, d + (c != P[i-1])))
+            if indels and 0 < i < len(P):
+                stack.append((i, new_top, new_bottom, d + 1))         # extra text symbol before P[i]
+    return hits
+
+class FMIndex:
+    """FM-index of a text, built once and queried for any number of patterns."""
+
+    def __init__(self, T:str, occ_step:int=64, sa_sample:int=32):
+        '''
+        :param T: text to index, an end character $ is appended if missing
+        :param occ_step: distance between two checkpoints of the Occ table, a rank query scans at most this many BWT characters
+        :param sa_sample: every text offset that is a multiple of this value is kept from the suffix array, a locate walks at most this many LF steps
+        '''
+        if not T or T[-1] != "$":
+            T += "$"
+        self.n = len(T)
+        self.occ_step = occ_step
+        self.sa_sample = sa_sample
+        sa = suffixArray(T)
+        text = toCodePoints(T)
+        L = text[sa - 1]                                      # sa - 1 is -1 for the rotation starting at 0, which wraps to the end character
+        self.L = L.tobytes().decode("ascii" if L.dtype == np.uint8 else "utf-32-le")
+        self.alphabet = sorted(set(self.L))
+        self.symbols = {char:s for s, char in enumerate(self.alphabet)}
+        # Occ checkpoints: occ[r, s] is the number of times symbol s appears in L[:r*occ_step]
+        self.occ = np.zeros((self.n // occ_step + 1, len(self.alphabet)), dtype=np.int32)
+        self.C = {}                                           # Index of each character's first occurrence (0th rank) in the F column of the BWM
+        preceding = 0
+        for s, char in enumerate(self.alphabet):
+            running = np.cumsum(L == ord(char), dtype=np.int32)
+            self.occ[1:, s] = running[occ_step-1::occ_step]
+            self.C[char] = preceding
+            preceding += int(running[-1])
+        # Sampled suffix array: BWM row -> text offset, for the rows whose offset is a multiple of sa_sample
+        rows = np.nonzero(sa % sa_sample == 0)[0]
+        self.sampled = dict(zip(rows.tolist(), sa[rows].tolist()))
+
+    def __len__(self):
+        return self.n
+
+    def rank(self, c:str, i:int):
+        """Number of occurrences of c in L[:i]."""
+        checkpoint = i // self.occ_step
+        start = checkpoint * self.occ_step
+        return int(self.occ[checkpoint, self.symbols[c]]) + self.L.count(c, start, i)
+
+    def extend(self, top:int, bottom:int, c:str):
+        """One backward-search step: rows prefixed by c followed by the prefix of rows [top, bottom)."""
+        if c not in self.C:
+            return 0, 0
+        return self.C[c] + self.rank(c, top), self.C[c] + self.rank(c, bottom)
+
+    def searchSymbols(self):
+        # Symbols a pattern can match, i.e. all but the end character
+        return [c for c in self.alphabet if c != "$"]
+
+    def interval(self, P:str):
+        """Backward search: range [top, bottom) of BWM rows prefixed by P."""
+        top, bottom = 0, self.n
+        for c in reversed(P):
+            top, bottom = self.extend(top, bottom, c)
+            if top >= bottom:
+                return 0, 0
+        return top, bottom
+
+    def count(self, P:str):
+        """Number of occurrences of P in the text."""
+        top, bottom = self.interval(P)
+        return bottom - top
+
+    def offset(self, row:int):
+        """Text offset of the suffix in a BWM row, walking LF until a sampled row is reached."""
+        steps = 0
+        while row not in self.sampled:
+            c = self.L[row]
+            row = self.C[c] + self.rank(c, row)
+            steps += 1
+        return self.sampled[row] + steps
+
+    def locate(self, P:str):
+        """Sorted offsets of every occurrence of P in the text."""
+        top, bottom = self.interval(P)
+        return sorted(self.offset(row) for row in range(top, bottom))
+
+    def locateApproximate(self, P:str, max_mismatches:int=0, max_edits:int=0):
+        """
+        Sorted (offset, distance) of every occurrence of P with at most max_mismatches substitutions,
+        or at most max_edits substitutions, insertions and deletions; the smallest distance is kept per offset.
+        """
+        distances = {}
+        for top, bottom, d in approximateIntervals(self, P, *differenceBudget(P, max_mismatches, max_edits)):
+            for row in range(top, bottom):
+                offset = self.offset(row)
+                distances[offset] = min(d, distances.get(offset, d))
+        return sorted(distances.items())
+
+class CollectionFMIndex:
+    """
+    Generalized FM-index over a collection of sequences: one index over seq1 # seq2 # ... seqk $, so a single
+    backward search finds a pattern in every sequence at once. The full suffix array is kept (4 bytes per base)
+    so each hit is a single lookup, and every part is a NumPy array that can be saved and memory-mapped back.
+    """
+
+    SEPARATOR = ord("#")
+    END = ord("$")
+    ARRAYS = ("L", "sa", "occ", "C", "symbol_of", "starts", "ids")
+
+    def __init__(self, sequences, ids, occ_step:int=64):
+        '''
+        :param sequences: ASCII sequences to index, as strings or uint8 arrays
+        :param ids: one identifier per sequence
+        :param occ_step: distance between two checkpoints of the Occ table
+        '''
+        if len(sequences) != len(ids) or len(sequences) == 0:
+            raise ValueError("Expected one ID per sequence and at least one sequence")
+        parts = []
+        starts = []
+        start = 0
+        for seq in sequences:
+            codes = seq if isinstance(seq, np.ndarray) else toCodePoints(seq)
+            if codes.dtype != np.uint8 or np.isin(codes, (self.SEPARATOR, self.END)).any():
+                raise ValueError("Sequences must be ASCII and must not contain '#' or '$'")
+            parts.extend((codes, np.array([self.SEPARATOR], dtype=np.uint8)))
+            starts.append(start)
+            start += len(codes) + 1
+        parts[-1] = np.array([self.END], dtype=np.uint8)          # the last separator becomes the end character
+        text = np.concatenate(parts)
+        self.occ_step = occ_step
+        self.sa = suffixArray(text).astype(np.int32)
+        self.L = text[self.sa - 1]
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ids = np.array(ids, dtype=str)
+        # Symbols are numbered in byte order, symbol_of maps a byte to its symbol (-1 for bytes not in the text)
+        alphabet = np.unique(self.L)
+        self.symbol_of = np.full(256, -1, dtype=np.int16)
+        self.symbol_of[alphabet] = np.arange(len(alphabet))
+        self.occ = np.zeros((len(text) // occ_step + 1, len(alphabet)), dtype=np.int32)
+        self.C = np.zeros(len(alphabet), dtype=np.int64)
+        preceding = 0
+        for s, code in enumerate(alphabet):
+            running = np.cumsum(self.L == code, dtype=np.int32)
+            self.occ[1:, s] = running[occ_step-1::occ_step]
+            self.C[s] = preceding
+            preceding += int(running[-1])
+
+    @classmethod
+    def load(cls, folder:str, mmap:bool=True):
+        """Index written by save(); with mmap the arrays are mapped from disk instead of read into memory."""
+        index = cls.__new__(cls)
+        for name in cls.ARRAYS + ("occ_step",):
+            path = os.path.join(folder, f"{name}.npy")
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"File not found: {path}")
+            setattr(index, name, np.load(path, mmap_mode="r" if mmap and name != "ids" else None))
+        index.occ_step = int(index.occ_step)
+        return index
+
+    def save(self, folder:str):
+        # Written to a temporary folder first, so readers never see a half-written index
+        tmp_folder = f"{folder}.{os.getpid()}.tmp"
+        os.makedirs(tmp_folder, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(tmp_folder, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(tmp_folder, "occ_step.npy"), np.array(self.occ_step))
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp_folder, folder)
+
+    def __len__(self):
+        return len(self.L)
+
+    def rank(self, s:int, code:int, i:int):
+        """Number of occurrences of symbol s (byte code) in L[:i]."""
+        checkpoint = i // self.occ_step
+        start = checkpoint * self.occ_step
+        return int(self.occ[checkpoint, s]) + int(np.count_nonzero(self.L[start:i] == code))
+
+    def extend(self, top:int, bottom:int, c:str):
+        """One backward-search step: rows prefixed by c followed by the prefix of rows [top, bottom)."""
+        code = ord(c)
+        s = int(self.symbol_of[code]) if code < 256 else -1
+        if s < 0:
+            return 0, 0
+        return int(self.C[s]) + self.rank(s, code, top), int(self.C[s]) + self.rank(s, code, bottom)
+
+    def searchSymbols(self):
+        # Symbols a pattern can match, i.e. all but the separator and end characters
+        return [chr(code) for code in np.nonzero(self.symbol_of >= 0)[0] if code not in (self.SEPARATOR, self.END)]
+
+    def interval(self, P:str):
+        """Backward search: range [top, bottom) of suffix array rows prefixed by P, empty if P could span two sequences."""
+        if not P or "#" in P or "$" in P:
+            return 0, 0
+        top, bottom = 0, len(self.L)
+        for c in reversed(P):
+            top, bottom = self.extend(top, bottom, c)
+            if top >= bottom:
+                return 0, 0
+        return top, bottom
+
+    def count(self, P:str):
+        """Number of occurrences of P in the whole collection."""
+        top, bottom = self.interval(P)
+        return bottom - top
+
+    def counts(self, P:str):
+        """Number of occurrences of P in each sequence."""
+        top, bottom = self.interval(P)
+        sequence = np.searchsorted(self.starts, self.sa[top:bottom], side="right") - 1
+        return np.bincount(sequence, minlength=len(self.starts))
+
+    def locate(self, P:str):
+        """Every occurrence of P as (sequence numbers, offsets within the sequence), sorted by sequence then offset."""
+        top, bottom = self.interval(P)
+        positions = np.sort(self.sa[top:bottom].astype(np.int64))
+        sequence = np.searchsorted(self.starts, positions, side="right") - 1
+        return sequence, positions - self.starts[sequence]
+
+    def search(self, P:str):
+        """Sorted offsets of P in each sequence, keyed by sequence ID (an empty list where P does not occur)."""
+        sequence, offsets = self.locate(P)
+        bounds = np.searchsorted(sequence, np.arange(len(self.starts) + 1))
+        return {str(ID): offsets[bounds[k]:bounds[k+1]].tolist() for k, ID in enumerate(self.ids)}
+
+    def searchApproximate(self, P:str, max_mismatches:int=0, max_edits:int=0):
+        """Sorted (offset, distance) of the approximate occurrences of P in each sequence, keyed by sequence ID."""
+        distances = {}
+        for top, bottom, d in approximateIntervals(self, P, *differenceBudget(P, max_mismatches, max_edits)):
+            for position in self.sa[top:bottom].tolist():
+                distances[position] = min(d, distances.get(position, d))
+        found = {str(ID): [] for ID in self.ids}
+        for position in sorted(distances):
+            k = int(np.searchsorted(self.starts, position, side="right")) - 1
+            found[str(self.ids[k])].append((position - int(self.starts[k]), distances[position]))
+        return found
+
 def FMIndexQuery(T, P):
-    # INITIALIZATION
-    L, offsets = BWT(T, True) # Start by converting T to BWT(T) for FM-indexing
-    char_count = {char:L.count(char) for char in set(L)} # Number of times each character shows up in the seq
-    char_Fpos = {char:sum(char_count[p] for p in set(L) if p < char) for char in set(L)} # For each character, sum the counts of all characters that precede it in the seq's alphabet, which results in the index of the character's first occurrence (0th rank) in the F column of the BWM
-    # FM INDEX QUERY
-    if P[-1] in T:
-        prefix_indexes = [x for x in range(char_Fpos[P[-1]], char_Fpos[P[-1]]+char_count[P[-1]])] # Initial range is indexes of F that match the last character of P => All rotations of T that have P[-1] as a prefix
-    else: 
+    # Single-shot query, kept for callers that do not hold on to an FMIndex
+    if P[-1] not in T:
         return None # If the last character is not even present in T, the search doesn't start, as the initial range would be empty
-    query_char = -2
-    while query_char >= (-len(P)):
-        c = P[query_char]
-        matching_prefix_indexes = [e for e in prefix_indexes if L[e] == c] # The range is restricted by querying for the previous character in the query string P
-        prefix_indexes = matching_prefix_indexes
-        if len(prefix_indexes) == 0: # Stop the search if no rotations have P's suffix as their prefix
-            break
-        bottom_rank = L[:prefix_indexes[0]].count(c)
-        bottom_index = char_Fpos[c] + bottom_rank # FL mapping of the first matching character in L to F, all other characters follow
-        top_index = bottom_index + len(prefix_indexes) # These two indexes define the range for the next query
-        prefix_indexes = [x for x in range(bottom_index, top_index)]
-        query_char -= 1
-    return len(prefix_indexes), sorted([offsets[i] for i in prefix_indexes]) # Return number of hits + offset of each hit within T
+    index = FMIndex(T)
+    positions = index.locate(P)
+    return len(positions), positions # Return number of hits + offset of each hit within T
@@ -0,0 +1,93 @@
+import mmap
+import os
+import struct
+import numpy as np
+from parser import read_fasta
+from models import MitochondrialDNA
+
+# Store file layout: MAGIC | index offset (uint64) | sequence blob | index
+# The blob holds every sequence's bases back to back as bytes; the index is UTF-8 text with one
+# "id<TAB>offset<TAB>length<TAB>description" line per record, like a .fai index.
+MAGIC = b"MTDNA001"
+HEADER = struct.Struct("<8sQ")
+STORE_SUFFIX = ".store"
+
+def build_store(fasta_path:str, store_path:str = None):
+    '''
+    Convert a FASTA file into a genome store, streaming one record at a time.
+    :param fasta_path: FASTA file to convert
+    :param store_path: output file, defaults to the FASTA path with .store appended
+    :return: path of the written store
+    '''
+    store_path = store_path or fasta_path + STORE_SUFFIX
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    index_lines = []
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, 0))
+        offset = HEADER.size
+        for ID, description, seq in read_fasta(fasta_path):
+            data = seq.encode("ascii")
+            out.write(data)
+            index_lines.append(f"{ID}\t{offset}\t{len(data)}\t{description}\n")
+            offset += len(data)
+        if not index_lines:
+            out.close()
+            os.remove(tmp_path)
+            raise ValueError(f"No valid records found in file: {fasta_path}")
+        out.write("".join(index_lines).encode("utf-8"))
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, offset))
+    os.replace(tmp_path, store_path)  # readers see either the old store or the complete new one
+    return store_path
+
+class GenomeStore:
+    """Read-only, memory-mapped genome store: genomes are materialized by ID on demand as views over the mapping."""
+
+    def __init__(self, store_path:str):
+        try:
+            handle = open(store_path, "rb")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File not found: {store_path}")
+        with handle:
+            self.map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a genome store: {store_path}")
+        self.path = store_path
+        self.ids = []
+        self.records = {}
+        for line in self.map[index_offset:].decode("utf-8").splitlines():
+            ID, offset, length, description = line.split("\t", 3)
+            self.ids.append(ID)
+            self.records[ID] = (int(offset), int(length), description)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, ID):
+        return ID in self.records
+
+    def __getitem__(self, ID):
+        return self.get(ID)
+
+    def __iter__(self):
+        for ID in self.ids:
+            yield self.get(ID)
+
+    def get(self, ID:str):
+        """Genome with this ID, its bases a zero-copy view of the mapped file."""
+        if ID not in self.records:
+            raise KeyError(f"Genome not found in store: {ID}")
+        offset, length, description = self.records[ID]
+        codes = np.frombuffer(self.map, dtype=np.uint8, count=length, offset=offset)
+        return MitochondrialDNA.from_codes(codes, ID, description)
+
+    def close(self):
+        self.map.close()
+
+def open_store(fasta_path:str):
+    """Store for a FASTA file, (re)built only when missing or older than the FASTA file."""
+    store_path = fasta_path + STORE_SUFFIX
+    if not os.path.exists(store_path) or os.path.getmtime(store_path) < os.path.getmtime(fasta_path):
+        build_store(fasta_path, store_path)
+    return GenomeStore(store_path)
@@ -1,5 +1,7 @@
 # Needleman and Wunsch algorithm for global sequence alignment
 
+from alignment_result import AlignmentResult, MATCH, MISMATCH, INSERTION, DELETION
+
 def assignScore(a, b, match, mismatch):
     if a == b:
         return match
@@ -7,30 +9,23 @@ def assignScore(a, b, match, mismatch):
         return mismatch
     
 def traceback(A, B, i, j, M):
-    seqA = ""
-    seqcomp = ""
-    seqB = ""
+    # One CIGAR operation per column, collected from the end of the alignment backwards
+    ops = []
     while M[i][j] != "STOP":
         if M[i][j] == "DIAG":
-            seqA = A[i-1] + seqA
-            seqB = B[j-1] + seqB
             if A[i-1] == B[j-1]:
-                seqcomp = "*" + seqcomp
+                ops.append(MATCH)
             else:
-                seqcomp = "|" + seqcomp
+                ops.append(MISMATCH)
             i -= 1
             j -= 1
         elif M[i][j] == "UP":
-            seqA = A[i-1] + seqA
-            seqB = "-" + seqB
-            seqcomp = " " + seqcomp
+            ops.append(INSERTION)
             i -= 1
         elif M[i][j] == "LEFT":
-            seqA = "-" + seqA
-            seqB = B[j-1] + seqB
-            seqcomp = " " + seqcomp
+            ops.append(DELETION)
             j -= 1
-    return [seqA, seqcomp, seqB]
+    return i, j, ops
 
 def globalAlignment(A, B, gap_pen, match, mismatch):
     m = len(A)                                                        # number of rows
@@ -61,8 +56,9 @@ def globalAlignment(A, B, gap_pen, match, mismatch):
             elif best_score == v3:
                 cM[i].append("LEFT")
     # TRACEBACK
-    alignment = traceback(A, B, m, n, cM)
     score = sM[m][n]
+    i, j, ops = traceback(A, B, m, n, cM)
+    alignment = AlignmentResult.from_traceback(A, B, i, j, ops, score)
     return alignment, score
 
 
@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue already holds max_pending jobs."""
+
+class JobCancelled(Exception):
+    """Raised inside a running job, at its next progress report, once the job has been cancelled."""
+
+class Job:
+    """One queued analysis: its state, progress and, once finished, its result or error."""
+
+    def __init__(self, kind:str, func, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "queued"  # queued -> running -> done | failed | cancelled
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+
+    def report(self, done:int, total:int):
+        """Progress callback handed to the job's function; also where a cancellation takes effect."""
+        self.done = done
+        self.total = total
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+    @property
+    def progress(self):
+        if self.status == "done":
+            return 1.0
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def finished_or_cancelled(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "done": self.done,
+            "total": self.total,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+class JobQueue:
+    """
+    In-process job queue: a bounded queue in front of a fixed pool of worker threads, so long analyses
+    run outside the request. Submitting to a full queue raises QueueFull (backpressure), finished jobs
+    are kept for retention seconds, and queued or running jobs can be cancelled.
+    """
+
+    def __init__(self, workers:int = 2, max_pending:int = 16, retention:float = 600):
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.retention = retention
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self.work, name=f"job-worker-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, kind:str, func, *args, **kwargs):
+        """Queue func(*args, progress=job.report, **kwargs) and return its Job without waiting."""
+        job = Job(kind, func, args, kwargs)
+        self.purge()
+        try:
+            self.pending.put_nowait(job)
+        except queue.Full:
+            raise QueueFull(f"Too many pending jobs ({self.pending.maxsize}), try again later")
+        with self.lock:
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id:str):
+        """Job for an ID, or None if unknown or expired."""
+        self.purge()
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id:str):
+        """Cancel a queued job, or ask a running one to stop at its next progress report."""
+        job = self.get(job_id)
+        if job is None or job.finished_or_cancelled:
+            return False
+        job.cancel_event.set()
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished = time.time()
+        return True
+
+    def purge(self):
+        # Forget finished jobs once their retention time has passed
+        now = time.time()
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items() if job.finished and now - job.finished > self.retention]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+    def work(self):
+        while True:
+            job = self.pending.get()
+            try:
+                if job.cancel_event.is_set():
+                    continue
+                job.status = "running"
+                job.started = time.time()
+                try:
+                    job.result = job.func(*job.args, progress=job.report, **job.kwargs)
+                    job.status = "done"
+                except JobCancelled:
+                    job.status = "cancelled"
+                except Exception as e:
+                    job.error = f"{type(e).__name__}: {e}"
+                    job.status = "failed"
+                    traceback.print_exc()
+                job.finished = time.time()
+                job.func = job.args = job.kwargs = None  # release the inputs, only the result is retained
+            finally:
+                self.pending.task_done()
@@ -0,0 +1,104 @@
+# K-mer counting over a collection of genomes. Bases are encoded with 2 bits, so a k-mer is an integer built by
+# rolling shifts over the whole sequence at once, and counting is a bincount (when the 4**k counters are no more than
+# the k-mers counted) or a sort.
+
+import numpy as np
+
+BASES = "ACGT"
+TWO_BIT = np.full(256, -1, dtype=np.int8)                            # byte -> 2-bit code, -1 for anything but ACGT
+for code, base in enumerate(BASES):
+    TWO_BIT[ord(base)] = code
+    TWO_BIT[ord(base.lower())] = code
+MAX_K = 32                                                            # 2k bits have to fit in a uint64
+
+def kmerDtype(k):
+    return np.uint32 if k <= 16 else np.uint64
+
+def kmerCodes(codes, k):
+    # 2-bit codes of every k-mer of a sequence (ASCII bytes), in order; k-mers containing N or other symbols are left out
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f"k must be between 1 and {MAX_K}")
+    dtype = kmerDtype(k)
+    values = TWO_BIT[codes]
+    count = len(values) - k + 1
+    if count <= 0:
+        return np.zeros(0, dtype=dtype)
+    invalid = values < 0
+    bits = np.where(invalid, 0, values).astype(dtype)
+    kmers = np.zeros(count, dtype=dtype)
+    for t in range(k):                                                # Horner's rule, one shift per position of the k-mer
+        kmers <<= dtype(2)
+        kmers |= bits[t:t+count]
+    if invalid.any():
+        seen = np.concatenate(([0], np.cumsum(invalid)))
+        kmers = kmers[seen[k:] == seen[:count]]                       # windows without any invalid symbol
+    return kmers
+
+def useBincount(k, n):
+    # A bincount allocates and scans 4**k counters whatever n is: only worth it while they do not outnumber the n k-mers
+    # (k <= 7 for a 16.5 kb genome), a sort of the n k-mers is cheaper beyond
+    return 4 ** k <= max(n, 1)
+
+def countKmers(kmers, k):
+    # Distinct k-mers (sorted) and how often each occurs
+    if useBincount(k, len(kmers)):
+        counts = np.bincount(kmers, minlength=4 ** k)
+        distinct = np.nonzero(counts)[0]
+        return distinct.astype(kmerDtype(k)), counts[distinct]
+    return np.unique(kmers, return_counts=True)
+
+def kmerString(code, k):
+    # Bases of a 2-bit k-mer code
+    code = int(code)
+    return "".join(BASES[(code >> (2 * (k - 1 - t))) & 3] for t in range(k))
+
+def kmerCode(kmer):
+    # 2-bit code of a k-mer given as a string
+    codes = kmerCodes(np.frombuffer(kmer.encode("ascii"), dtype=np.uint8), len(kmer))
+    if len(codes) != 1:
+        raise ValueError(f"Not a k-mer over {BASES}: {kmer}")
+    return codes[0]
+
+class KmerCounter:
+    """K-mer counts of every genome of a collection, and how many genomes share each k-mer."""
+
+    def __init__(self, sequences, ids, k):
+        '''
+        :param sequences: sequences as strings or uint8 arrays of ASCII bases
+        :param ids: one identifier per sequence
+        :param k: k-mer length
+        '''
+        self.k = k
+        self.ids = list(ids)
+        self.per_genome = []                                          # (distinct k-mers, counts) of each genome
+        for seq in sequences:
+            codes = seq if isinstance(seq, np.ndarray) else np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
+            self.per_genome.append(countKmers(kmerCodes(codes, k), k))
+        # Collection totals: stacking each genome's distinct k-mers makes the number of genomes holding a k-mer a count
+        stacked = np.concatenate([kmers for kmers, _ in self.per_genome] or [np.zeros(0, dtype=kmerDtype(k))])
+        weights = np.concatenate([counts for _, counts in self.per_genome] or [np.zeros(0, dtype=np.int64)])
+        if useBincount(k, len(stacked)):
+            genomes = np.bincount(stacked, minlength=4 ** k)
+            self.kmers = np.nonzero(genomes)[0].astype(kmerDtype(k))
+            self.genome_counts = genomes[self.kmers]
+            self.total_counts = np.bincount(stacked, weights=weights, minlength=4 ** k)[self.kmers].astype(np.int64)
+        else:
+            self.kmers, inverse, self.genome_counts = np.unique(stacked, return_inverse=True, return_counts=True)
+            self.total_counts = np.bincount(inverse, weights=weights, minlength=len(self.kmers)).astype(np.int64)
+
+    def topConserved(self, n):
+        # The n k-mers found in the most genomes, ties broken by total number of occurrences, then by k-mer
+        order = np.lexsort((self.kmers, -self.total_counts, -self.genome_counts))[:n]
+        return self.kmers[order], self.genome_counts[order], self.total_counts[order]
+
+    def matrix(self, kmers, presence=False):
+        # Genomes x k-mers matrix of counts (or 0/1 presence) for the given k-mer codes
+        kmers = np.asarray(kmers, dtype=kmerDtype(self.k))
+        result = np.zeros((len(self.per_genome), len(kmers)), dtype=np.int64)
+        for g, (distinct, counts) in enumerate(self.per_genome):
+            if len(distinct) == 0:
+                continue
+            at = np.minimum(np.searchsorted(distinct, kmers), len(distinct) - 1)
+            found = distinct[at] == kmers
+            result[g, found] = 1 if presence else counts[at[found]]
+        return result
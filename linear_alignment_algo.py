@@ -0,0 +1,116 @@
+# Linear-memory global and local alignment for sequences too long for a full traceback matrix.
+# Hirschberg-style divide and conquer: the rows between the first row and the end of the traceback are
+# halved repeatedly, and only blocks small enough for the cell budget get a (packed) traceback matrix.
+# Unlike textbook Hirschberg the split uses forward rows only, so the traceback takes exactly the same
+# DIAG/UP/LEFT decisions as globalAlignment/localAlignment and the alignment is identical, not just as good.
+
+import numpy as np
+from numpy_alignment_algo import STOP, DIAG, UP, LEFT, encodeSequence, scoreDtype, SubstitutionProfile, fillRow, rowCodes, packCodes
+from alignment_result import AlignmentResult, MATCH, MISMATCH, INSERTION, DELETION
+
+BLOCK_CELLS = 1 << 20                                                 # largest block solved with a traceback matrix (packed, 256 KB)
+
+class LinearAligner:
+    """One alignment problem: the sequences, scoring, and the shifted scores S'[i][j] = S[i][j] - j*gap_pen shared with the NumPy engine."""
+
+    def __init__(self, A, B, gap_pen, match, mismatch, local, block_cells=BLOCK_CELLS):
+        self.A = A
+        self.B = B
+        self.gap_pen = gap_pen
+        self.local = local
+        self.block_cells = block_cells
+        dtype = scoreDtype(len(A), len(B), gap_pen, match, mismatch)
+        self.codesA = encodeSequence(A)
+        self.profile = SubstitutionProfile(B, gap_pen, match, mismatch, dtype)
+        self.ramp = np.arange(len(B) + 1, dtype=dtype) * dtype(gap_pen)
+        self.floor = -self.ramp if local else None
+        self.first_row = self.floor.copy() if local else np.zeros(len(B) + 1, dtype=dtype)
+
+    def forwardRows(self, top, i0, i1, jend, track_max=False):
+        # Shifted row i1 over columns 0..jend from shifted row i0, keeping one row at a time.
+        # With track_max, also the first strictly highest real score in row-major order (the local alignment end)
+        prev = top[:jend+1]
+        floor = self.floor[:jend+1] if self.local else None
+        ramp = self.ramp[:jend+1]
+        max_score, max_i, max_j = 0, 0, 0
+        for i in range(i0 + 1, i1 + 1):
+            first = 0 if self.local else i * self.gap_pen
+            prev = fillRow(prev, self.profile[self.codesA[i-1]][:jend], self.gap_pen, first, floor)[0]
+            if track_max:
+                real = prev + ramp
+                row_max = real.max()
+                if row_max > max_score:
+                    max_score, max_i, max_j = int(row_max), i, int(real.argmax())
+        return prev, (max_score, max_i, max_j)
+
+    def fillBlock(self, top, i0, i1, jend):
+        # Packed traceback codes of rows i0..i1 over columns 0..jend, row i0 being given (top)
+        block = np.zeros((i1 - i0 + 1, 4 * ((jend + 4) // 4)), dtype=np.uint8)
+        if self.local:
+            block[0] = STOP
+        elif i0 == 0:
+            block[0, :jend+1] = LEFT
+            block[0, 0] = STOP
+        floor = self.floor[:jend+1] if self.local else None
+        prev = top[:jend+1]
+        for i in range(i0 + 1, i1 + 1):
+            r = i - i0
+            block[r, 0] = STOP if self.local else UP
+            first = 0 if self.local else i * self.gap_pen
+            cur, v1, v2 = fillRow(prev, self.profile[self.codesA[i-1]][:jend], self.gap_pen, first, floor)
+            codes = rowCodes(cur, v1, v2, block[r, 1:jend+1])
+            if self.local:
+                np.multiply(codes, cur[1:] != floor[1:], out=codes)
+            prev = cur
+        return packCodes(block)
+
+    def tracebackBlock(self, packed, i0, i, j, ops):
+        # Walk the codes from (i, j) until row i0 is reached (rows above belong to another block) or a STOP cell.
+        # CIGAR operations are appended to ops from the end of the alignment backwards
+        A, B = self.A, self.B
+        width = packed.shape[1]
+        cells = packed.tobytes()
+        while i > i0 or i0 == 0:
+            code = (cells[(i - i0)*width + (j >> 2)] >> ((j & 3) << 1)) & 3
+            if code == STOP:
+                return i, j, True
+            if code == DIAG:
+                ops.append(MATCH if A[i-1] == B[j-1] else MISMATCH)
+                i -= 1
+                j -= 1
+            elif code == UP:
+                ops.append(INSERTION)
+                i -= 1
+            else:
+                ops.append(DELETION)
+                j -= 1
+        return i, j, False
+
+    def solve(self, top, i0, i1, jend, ops):
+        # Trace the alignment back from (i1, jend) to row i0, given the shifted scores of row i0
+        if (i1 - i0 + 1) * (jend + 1) <= self.block_cells or i1 - i0 <= 1:
+            return self.tracebackBlock(self.fillBlock(top, i0, i1, jend), i0, i1, jend, ops)
+        mid = (i0 + i1) // 2
+        row_mid = self.forwardRows(top, i0, mid, jend)[0]
+        i, j, stopped = self.solve(row_mid, mid, i1, jend, ops)       # the end of the path lies in the lower half
+        del row_mid
+        if stopped:
+            return i, j, True
+        return self.solve(top, i0, mid, j, ops)                        # continue from where the path entered row mid
+
+    def align(self):
+        ops = []
+        if self.local:
+            _, (score, end_i, end_j) = self.forwardRows(self.first_row, 0, len(self.A), len(self.B), track_max=True)
+        else:
+            last_row = self.forwardRows(self.first_row, 0, len(self.A), len(self.B))[0]
+            score = int(last_row[-1]) + len(self.B) * self.gap_pen
+            end_i, end_j = len(self.A), len(self.B)
+        start_i, start_j, _ = self.solve(self.first_row, 0, end_i, end_j, ops)
+        return AlignmentResult.from_traceback(self.A, self.B, start_i, start_j, ops, score), score
+
+def globalAlignmentLinear(A, B, gap_pen, match, mismatch, block_cells=BLOCK_CELLS):
+    return LinearAligner(A, B, gap_pen, match, mismatch, False, block_cells).align()
+
+def localAlignmentLinear(A, B, gap_pen, match, mismatch, block_cells=BLOCK_CELLS):
+    return LinearAligner(A, B, gap_pen, match, mismatch, True, block_cells).align()
@@ -1,4 +1,6 @@
 # Smith and Waterman algorithm for local sequence alignment
+
+from alignment_result import AlignmentResult, MATCH, MISMATCH, INSERTION, DELETION
         
 def assignScore(a, b, match, mismatch):
     if a == b:
@@ -6,31 +8,24 @@ def assignScore(a, b, match, mismatch):
     else:
         return mismatch
     
-def traceback(A, B, i, j, M):    
-    seqA = ""
-    seqcomp = ""
-    seqB = ""
+def traceback(A, B, i, j, M):
+    # One CIGAR operation per column, collected from the end of the alignment backwards
+    ops = []
     while M[i][j] != "STOP":
         if M[i][j] == "DIAG":
-            seqA = A[i-1] + seqA
-            seqB = B[j-1] + seqB
             if A[i-1] == B[j-1]:
-                seqcomp = "*" + seqcomp
+                ops.append(MATCH)
             else:
-                seqcomp = "|" + seqcomp
+                ops.append(MISMATCH)
             i -= 1
             j -= 1
         elif M[i][j] == "UP":
-            seqA = A[i-1] + seqA
-            seqB = "-" + seqB
-            seqcomp = " " + seqcomp
+            ops.append(INSERTION)
             i -= 1
         elif M[i][j] == "LEFT":
-            seqA = "-" + seqA
-            seqB = B[j-1] + seqB
-            seqcomp = " " + seqcomp
+            ops.append(DELETION)
             j -= 1
-    return [seqA, seqcomp, seqB]
+    return i, j, ops
 
 def localAlignment(A, B, gap_pen, match, mismatch):
     m = len(A)                               # number of rows
@@ -67,7 +62,8 @@ def localAlignment(A, B, gap_pen, match, mismatch):
             elif best_score == v3:
                 cM[i].append("LEFT")
     # TRACEBACK
-    alignment = traceback(A, B, max_i, max_j, cM)
+    i, j, ops = traceback(A, B, max_i, max_j, cM)
+    alignment = AlignmentResult.from_traceback(A, B, i, j, ops, max_score)
     return alignment, max_score
 
 
@@ -0,0 +1,229 @@
+import cProfile
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Lightweight instrumentation: per-stage wall time histograms, call and DP cell counters and peak allocations,
+# rendered in the Prometheus text format. Everything is off by default; a disabled timed() costs one attribute check.
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Settings:
+    def __init__(self):
+        self.timing = False       # wall time, calls and counters
+        self.memory = False       # peak traced allocation per stage (tracemalloc, slow)
+        self.profile_dir = None   # folder for per-request cProfile dumps, None to disable them
+
+settings = Settings()
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values, with their count and sum."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value:float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+class Registry:
+    """All recorded metrics, keyed by metric name and label values."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}  # (name, labels) -> Histogram
+            self.counters = {}    # (name, labels) -> total
+            self.gauges = {}      # (name, labels) -> highest value seen
+
+    def observe(self, name:str, value:float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def increment(self, name:str, amount:float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def maximum(self, name:str, value:float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = max(value, self.gauges.get(key, value))
+
+    def snapshot(self):
+        """Copy of the recorded metrics, picklable (e.g. to send them from a pool worker to merge())."""
+        with self.lock:
+            return {"histograms": dict(self.histograms), "counters": dict(self.counters), "gauges": dict(self.gauges)}
+
+    def merge(self, snapshot):
+        """Add the metrics of a snapshot (another process's registry) to these."""
+        with self.lock:
+            for key, other in snapshot["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(other.buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, other.counts)]
+                histogram.count += other.count
+                histogram.sum += other.sum
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, value in snapshot["gauges"].items():
+                self.gauges[key] = max(value, self.gauges.get(key, value))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, kind, values in (("counters", "counter", self.counters), ("gauges", "gauge", self.gauges)):
+                for metric in sorted({key[0] for key in values}):
+                    lines.append(f"# TYPE {metric} {kind}")
+                    for (key_name, labels), value in sorted(values.items()):
+                        if key_name == metric:
+                            lines.append(f"{metric}{format_labels(labels)} {value}")
+            for metric in sorted({key[0] for key in self.histograms}):
+                lines.append(f"# TYPE {metric} histogram")
+                for (key_name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if key_name != metric:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{metric}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+registry = Registry()
+_local = threading.local()
+
+def configure(timing:bool = None, memory:bool = None, profile_dir:str = None):
+    """Switch instrumentation on or off; memory implies timing, and starts tracemalloc."""
+    if timing is not None:
+        settings.timing = timing
+    if memory is not None:
+        settings.memory = memory
+        settings.timing = settings.timing or memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    if profile_dir is not None:
+        settings.profile_dir = profile_dir or None
+
+def configure_from_environment(default_timing:bool = False):
+    """Settings from MTDNA_METRICS (0/1), MTDNA_METRICS_MEMORY (0/1) and MTDNA_PROFILE_DIR."""
+    configure(
+        timing=os.environ.get("MTDNA_METRICS", "1" if default_timing else "0") != "0",
+        memory=os.environ.get("MTDNA_METRICS_MEMORY", "0") != "0",
+        profile_dir=os.environ.get("MTDNA_PROFILE_DIR", ""),
+    )
+
+@contextmanager
+def stage(name:str):
+    """Time a block as a stage (and track its peak allocation when memory is on)."""
+    if not settings.timing:
+        yield
+        return
+    if settings.memory:
+        # Nested stages: each keeps the highest peak of its children, since reset_peak is global to tracemalloc
+        peaks = getattr(_local, "peaks", None)
+        if peaks is None:
+            peaks = _local.peaks = []
+        peaks.append(0)
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe("mtdna_stage_seconds", time.perf_counter() - start, stage=name)
+        registry.increment("mtdna_stage_calls_total", stage=name)
+        if settings.memory:
+            peak = max(tracemalloc.get_traced_memory()[1] - start_memory, peaks.pop())
+            registry.maximum("mtdna_stage_peak_bytes", peak, stage=name)
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+
+def timed(name:str):
+    """Decorator recording every call of the function as a stage."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not settings.timing:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name:str, amount:float = 1, **labels):
+    """Add to a counter, e.g. DP cells filled by a kernel."""
+    if settings.timing:
+        registry.increment(name, amount, **labels)
+
+def render():
+    return registry.render()
+
+def task_options():
+    # Settings a pool task runs with: worker processes start with everything off
+    return {"timing": settings.timing, "memory": settings.memory}
+
+def call_recorded(options, func, *args):
+    """
+    Run func(*args) in a pool worker with the caller's settings (task_options()), and return its result with the
+    metrics it recorded (None when timing is off), for the caller to merge() into its registry.
+    """
+    configure(**options)
+    if not settings.timing:
+        return func(*args), None
+    registry.reset()  # a worker runs one task at a time: its registry then only holds this task's metrics
+    result = func(*args)
+    return result, registry.snapshot()
+
+def profiled(name:str, func):
+    """func run under its own RequestProfiler, e.g. a job started by a profiled request (cProfile sees one thread)."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = RequestProfiler(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.dump()
+    return wrapper
+
+class RequestProfiler:
+    """cProfile of one request, dumped as <endpoint>-<time>.prof into the profile folder."""
+
+    def __init__(self, endpoint:str):
+        self.endpoint = endpoint or "request"
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def dump(self):
+        self.profiler.disable()
+        os.makedirs(settings.profile_dir, exist_ok=True)
+        path = os.path.join(settings.profile_dir, f"{self.endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof")
+        self.profiler.dump_stats(path)
+        return path
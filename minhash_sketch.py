@@ -0,0 +1,81 @@
+# FracMinHash sketches: a k-mer is kept when its hash falls in the lowest 1/scaled of the hash range, so every genome
+# keeps the same k-mers, a sketch's size follows its genome's length, and the Jaccard index of two genomes is estimated
+# from their sketches alone. The identity estimate is Mash's, 1 + ln(2J / (1 + J)) / k.
+# K-mers are taken on the given strand only: the genomes of a collection are expected in the same orientation.
+
+import numpy as np
+from kmer_counter import kmerCodes
+
+DEFAULT_K = 14
+DEFAULT_SCALED = 20                                                   # about one k-mer in 20 is kept
+HASH_MAX = np.iinfo(np.uint64).max
+
+def hashKmers(kmers):
+    # splitmix64 finalizer over the 2-bit k-mer codes: cheap, and well mixed enough for sampling (uint64 arithmetic wraps)
+    x = kmers.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def sketchHashes(codes, k=DEFAULT_K, scaled=DEFAULT_SCALED):
+    # Sorted distinct hashes of the sequence's k-mers (ASCII bytes) that fall under the sampling threshold
+    if scaled < 1:
+        raise ValueError("scaled must be at least 1")
+    hashes = hashKmers(kmerCodes(codes, k))
+    return np.unique(hashes[hashes <= np.uint64(HASH_MAX // scaled)])
+
+def jaccard(a, b):
+    # Jaccard index of two sketches (sorted distinct hashes)
+    shared = len(np.intersect1d(a, b, assume_unique=True))
+    union = len(a) + len(b) - shared
+    return shared / union if union else 0.0
+
+def identityFromJaccard(j, k):
+    # Estimated identity (%) of two sequences from the Jaccard index of their k-mer sets, 0 when nothing is shared
+    j = np.asarray(j, dtype=np.float64)
+    safe = np.where(j > 0, j, 1.0)
+    identity = 1 + np.log(2 * safe / (1 + safe)) / k
+    return np.where(j > 0, np.clip(identity, 0, 1), 0.0) * 100
+
+class SketchCollection:
+    """Sketches of a whole genome collection in one array, so one genome is scored against all of them at once."""
+
+    def __init__(self, sketches, ids, k=DEFAULT_K, scaled=DEFAULT_SCALED):
+        '''
+        :param sketches: one sketch (sorted distinct hashes, from sketchHashes) per genome
+        :param ids: one identifier per genome
+        :param k, scaled: parameters the sketches were built with
+        '''
+        self.k = k
+        self.scaled = scaled
+        self.ids = list(ids)
+        self.sizes = np.array([len(sketch) for sketch in sketches], dtype=np.int64)
+        # All hashes sorted once, with the genome each comes from: a query sketch then only needs binary searches
+        hashes = np.concatenate(list(sketches) or [np.zeros(0, dtype=np.uint64)])
+        owner = np.repeat(np.arange(len(self.sizes), dtype=np.int32), self.sizes)
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.owner = owner[order]
+
+    def similarities(self, sketch):
+        """Estimated Jaccard index and identity (%) of one sketch against every genome of the collection."""
+        lo = np.searchsorted(self.hashes, sketch, side="left")
+        hits = np.searchsorted(self.hashes, sketch, side="right") - lo    # genomes holding each hash of the sketch
+        first = np.repeat(lo - (np.cumsum(hits) - hits), hits)
+        shared = np.bincount(self.owner[first + np.arange(len(first))], minlength=len(self.sizes))
+        union = self.sizes + len(sketch) - shared
+        j = np.divide(shared, union, out=np.zeros(len(self.sizes)), where=union > 0)
+        return j, identityFromJaccard(j, self.k)
+
+    def rank(self, sketch, top_n=None, min_identity=None):
+        """
+        Genomes closest to the sketch, best first.
+        :return: list of (ID, estimated identity), at most top_n of them and only those reaching min_identity
+        """
+        identities = self.similarities(sketch)[1]
+        order = np.argsort(-identities, kind="stable")
+        if min_identity is not None:
+            order = order[identities[order] >= min_identity]
+        if top_n is not None:
+            order = order[:top_n]
+        return [(self.ids[g], float(identities[g])) for g in order]
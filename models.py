@@ -2,64 +2,274 @@ from parser import *
 from global_alignment_algo import *
 from local_alignment_algo import *
 from fm_index_query import *
+from numpy_alignment_algo import *
+from linear_alignment_algo import *
+from banded_alignment_algo import *
+from edit_distance_algo import *
+from composition_profile import *
+from minhash_sketch import sketchHashes, DEFAULT_K, DEFAULT_SCALED
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import threading
+import metrics
+
+def sequence_hash(seq:str):
+    """Digest identifying a sequence's content, used as a cache key."""
+    return hashlib.blake2b(seq.encode(), digest_size=16).digest()
 
 class MitochondrialDNA:
+    """
+    Genome bases as a string (.seq, what the alignment and FM-index kernels read) and as a NumPy uint8 array (.codes,
+    for composition and zero-copy views). Each is built from the other on first use and then kept.
+    """
+
+    __slots__ = ("_codes", "_seq", "ID", "description", "fm_index", "prefix_counts", "sketch")
     
     def __init__(self, seq:str, ID:str, description:str = ""):
         self.seq = seq
         self.ID = ID
         self.description = description
+        self.fm_index = None
+        self.prefix_counts = None
+        self.sketch = None
+
+    @classmethod
+    def from_codes(cls, codes, ID:str, description:str = ""):
+        """Genome around an existing uint8 array of bases (e.g. a view of a memory-mapped store), without copying it."""
+        genome = cls.__new__(cls)
+        genome._codes = codes
+        genome._seq = None
+        genome.ID = ID
+        genome.description = description
+        genome.fm_index = None
+        genome.prefix_counts = None
+        genome.sketch = None
+        return genome
+
+    @property
+    def seq(self):
+        if self._seq is None:
+            self._seq = self._codes.tobytes().decode("ascii")
+        return self._seq
+
+    @seq.setter
+    def seq(self, value:str):
+        if not value.isascii():
+            raise ValueError("Sequence contains non-ASCII characters")
+        self._seq = value
+        self._codes = None
+        self.fm_index = None
+        self.prefix_counts = None
+        self.sketch = None
     
-    def get_subsequence(self, start:int, end:int):
-        if start < 0 or end > len(self.seq):
-            raise ValueError(f"Subsequence indices out of range: start={start}, end={end}, length={len(self.seq)}")
+    @property
+    def codes(self):
+        if self._codes is None:
+            self._codes = np.frombuffer(self._seq.encode("ascii"), dtype=np.uint8)  # read-only view over the bytes, no second copy
+        return self._codes
+
+    def get_subsequence(self, start:int, end:int, as_view:bool = False):
+        """Bases in [start, end) as a string, or with as_view a zero-copy uint8 view of the stored array."""
+        if start < 0 or end > self.get_length():
+            raise ValueError(f"Subsequence indices out of range: start={start}, end={end}, length={self.get_length()}")
+        elif as_view:
+            return self.codes[start:end]
+        elif self._seq is not None:
+            return self._seq[start:end]
         else:
-            return self.seq[start:end]
+            return self._codes[start:end].tobytes().decode("ascii")
+
+    def get_base_composition(self):
+        """Count of every character in the sequence, from a single pass over the array."""
+        counts = np.bincount(self.codes, minlength=256)
+        return {chr(code): int(counts[code]) for code in np.flatnonzero(counts)}
         
     def get_GC_content(self):
-        gc_count = self.seq.count("G") + self.seq.count("C")
-        return (gc_count/len(self.seq)) * 100
+        counts = np.bincount(self.codes, minlength=256)
+        gc_count = counts[ord("G")] + counts[ord("C")]
+        return (gc_count/len(self.codes)) * 100
     
     def get_length(self):
-        return len(self.seq)
+        return len(self._seq) if self._seq is not None else len(self._codes)
+
+    def get_prefix_counts(self):
+        """Cumulative A/C/G/T counts ((n+1) x 4), built on first use; any window's composition is a difference of two rows."""
+        if self.prefix_counts is None:
+            self.prefix_counts = prefixCounts(self.codes)
+        return self.prefix_counts
+
+    def get_composition(self, start:int, end:int):
+        """A, C, G and T counts of the bases in [start, end), in constant time."""
+        if start < 0 or end > self.get_length() or start > end:
+            raise ValueError(f"Window out of range: start={start}, end={end}, length={self.get_length()}")
+        counts = self.get_prefix_counts()
+        return dict(zip(BASES, (counts[end] - counts[start]).tolist()))
+
+    def get_window_profile(self, window:int, step:int = None, kind:str = "gc"):
+        """Starts of the windows of window bases every step bases (default: non-overlapping) and their GC content (%), GC skew or AT skew."""
+        starts = windowStarts(self.get_length(), window, step or window)
+        return starts, profileValues(windowCounts(self.get_prefix_counts(), starts, window), window, kind)
+
+    def get_sketch(self, k:int = DEFAULT_K, scaled:int = DEFAULT_SCALED):
+        """FracMinHash sketch of the sequence's k-mers (sorted hashes), built on first use for the last (k, scaled) asked."""
+        if self.sketch is None or self.sketch[:2] != (k, scaled):
+            self.sketch = (k, scaled, sketchHashes(self.codes, k, scaled))
+        return self.sketch[2]
+
+    def get_fm_index(self):
+        """FM-index of the sequence, built on first use and shared by every motif query."""
+        if self.fm_index is None:
+            self.fm_index = FMIndex(self.seq)
+        return self.fm_index
 
 class MotifFinder:
     
     def __init__(self, motif_seq:str):
         self.motif_seq = motif_seq
         
-    def count_occurrences(self, target_seq:str):
-        """Count occurrences of the motif in the sequence."""
-        occurrences = FMIndexQuery(target_seq, self.motif_seq)[0]
+    def get_index(self, target):
+        """FM-index of the target: the genome's own cached index, or a fresh one for a plain string."""
+        if isinstance(target, MitochondrialDNA):
+            return target.get_fm_index()
+        return FMIndex(target)
+
+    def count_occurrences(self, target):
+        """Count occurrences of the motif in the sequence (a MitochondrialDNA or a string)."""
+        occurrences = self.get_index(target).count(self.motif_seq)
         return occurrences
     
-    def search_motif(self, target_seq:str):
-        """Search for motifs in a sequence."""
-        search = FMIndexQuery(target_seq, self.motif_seq)[1]
+    def search_motif(self, target, max_mismatches:int = 0, max_edits:int = 0):
+        """Search for motifs in a sequence (a MitochondrialDNA or a string).
+        With max_mismatches or max_edits, approximate occurrences are found by backtracking on the FM-index
+        and returned as (offset, distance) pairs."""
+        if max_mismatches or max_edits:
+            return self.get_index(target).locateApproximate(self.motif_seq, max_mismatches, max_edits)
+        search = self.get_index(target).locate(self.motif_seq)
         return search
 
+    def search_collection(self, index:CollectionFMIndex, max_mismatches:int = 0, max_edits:int = 0):
+        """Search for the motif in every genome of a collection index at once: sorted positions keyed by genome ID
+        ((offset, distance) pairs when differences are allowed)."""
+        if max_mismatches or max_edits:
+            return index.searchApproximate(self.motif_seq, max_mismatches, max_edits)
+        return index.search(self.motif_seq)
+
 class SequenceAlignment:
+
+    MAX_CELLS = 25_000_000  # above this many DP cells (m*n) the linear-memory engine is used
+    CACHE_SIZE = 256        # results kept by the cache shared between all instances, least recently used evicted first
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
         
-    def __init__(self, seq1:str, seq2:str):
+    def __init__(self, seq1:str, seq2:str, max_cells:int = None):
         self.seq1 = seq1
         self.seq2 = seq2
+        self.max_cells = self.MAX_CELLS if max_cells is None else max_cells
+        self.band_used = None
+        self.band_sufficient = None
     
-    def align_sequences(self, gap_pen=-2, match=1, mismatch=-1, algo:str="global"):
-        """Align two mitochondrial DNA sequences"""
-        if algo == "global":
-            seq1_gapped, comparison, seq2_gapped = globalAlignment(self.seq1, self.seq2, gap_pen, match, mismatch)[0]
-        elif algo == "local":
-            seq1_gapped, comparison, seq2_gapped = localAlignment(self.seq1, self.seq2, gap_pen, match, mismatch)[0]
-        return seq1_gapped, comparison, seq2_gapped
+    def align_sequences(self, gap_pen=-2, match=1, mismatch=-1, algo:str="global", engine:str="numpy", band:int=None, adaptive_band:bool=False):
+        """Align two mitochondrial DNA sequences
+        With band, only diagonals within band of the main ones are computed (global only), widened until the
+        score is provably optimal if adaptive_band; band_used and band_sufficient then describe the band.
+        Returns an AlignmentResult, which unpacks into the gapped seq1, comparison line and gapped seq2 as before."""
+        entry = self.cached_result(gap_pen, match, mismatch, algo, band, adaptive_band)
+        if "alignment" not in entry:
+            if band is not None:
+                self.check_banded(algo, band, adaptive_band)
+                entry["alignment"], entry["score"], entry["band"], entry["sufficient"] = globalAlignmentBanded(
+                    self.seq1, self.seq2, gap_pen, match, mismatch, band, adaptive_band)
+            else:
+                entry["alignment"], entry["score"] = self.run_alignment(gap_pen, match, mismatch, algo, engine)
+        self.set_band_info(entry)
+        return entry["alignment"]
     
-    def get_alignment_scores(self, gap_pen=-2, match=1, mismatch=-1, algo:str="global"):
+    def get_alignment_scores(self, gap_pen=-2, match=1, mismatch=-1, algo:str="global", engine:str="numpy", band:int=None, adaptive_band:bool=False):
         """Return the alignment scores."""
-        if algo == "global":
-            score = globalAlignment(self.seq1, self.seq2, gap_pen, match, mismatch)[1]
-        elif algo == "local":
-            score = localAlignment(self.seq1, self.seq2, gap_pen, match, mismatch)[1]
+        entry = self.cached_result(gap_pen, match, mismatch, algo, band, adaptive_band)
+        if "score" not in entry:
+            if band is not None:
+                self.check_banded(algo, band, adaptive_band)
+                entry["score"], entry["band"], entry["sufficient"] = globalScoreBanded(
+                    self.seq1, self.seq2, gap_pen, match, mismatch, band, adaptive_band)
+            elif engine == "python":
+                entry["alignment"], entry["score"] = self.run_alignment(gap_pen, match, mismatch, algo, engine)
+            else:
+                score_only = globalScoreNumpy if algo == "global" else localScoreNumpy  # two DP rows, no traceback
+                self.check_algo(algo)
+                metrics.count("mtdna_dp_cells_total", len(self.seq1) * len(self.seq2), kernel=f"{algo}_score")
+                with metrics.stage(f"{algo}_score"):
+                    entry["score"] = score_only(self.seq1, self.seq2, gap_pen, match, mismatch)
+        self.set_band_info(entry)
+        score = entry["score"]
         return score
 
+    def set_band_info(self, entry):
+        self.band_used = entry.get("band")
+        self.band_sufficient = entry.get("sufficient")
+
+    def check_banded(self, algo, band, adaptive_band):
+        if algo != "global":
+            raise ValueError(f"Banded alignment only supports algo='global', got: {algo}")
+        if band < 0 or (adaptive_band and band < 1):
+            raise ValueError(f"Band must be at least 0 (at least 1 with adaptive_band), got: {band}")
+
+    def get_similarity(self, gap_pen=-2, match=1, mismatch=-1, algo:str="global", engine:str="numpy", band:int=None, adaptive_band:bool=False):
+        """Percentage of alignment columns that are matches."""
+        return self.align_sequences(gap_pen, match, mismatch, algo, engine, band, adaptive_band).identity
+
+    def get_edit_distance(self):
+        """Levenshtein distance of the two sequences and the identity (%) derived from it, computed with bit-parallel
+        columns (no DP matrix, no traceback): much cheaper than an alignment, but with unit costs instead of the scoring."""
+        entry = self.cached_result(None, None, None, "edit_distance")
+        if "edit_distance" not in entry:
+            metrics.count("mtdna_dp_cells_total", len(self.seq1) * len(self.seq2), kernel="edit_distance")
+            with metrics.stage("edit_distance"):
+                entry["edit_distance"] = editDistance(self.seq1, self.seq2)
+        distance = entry["edit_distance"]
+        return distance, editIdentity(distance, len(self.seq1), len(self.seq2))
+
+    def cached_result(self, gap_pen, match, mismatch, algo, band=None, adaptive_band=False):
+        """Cache entry for this pair and scoring, shared by alignment, score and similarity (created empty on a miss)."""
+        key = (sequence_hash(self.seq1), sequence_hash(self.seq2), gap_pen, match, mismatch, algo, band, adaptive_band and band is not None)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            else:
+                self._cache[key] = {}
+                while len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
+            return self._cache[key]
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    def check_algo(self, algo):
+        if algo not in ("global", "local"):
+            raise ValueError(f"Unknown alignment algo: {algo}")
+
+    def run_alignment(self, gap_pen, match, mismatch, algo, engine):
+        """Run one of the alignment kernels: "numpy" (vectorized rows, packed traceback), "python" (reference lists)
+        or "linear" (divide and conquer in O(n) memory, chosen automatically past max_cells)."""
+        kernels = {
+            ("global", "numpy"): globalAlignmentNumpy,
+            ("local", "numpy"): localAlignmentNumpy,
+            ("global", "python"): globalAlignment,
+            ("local", "python"): localAlignment,
+            ("global", "linear"): globalAlignmentLinear,
+            ("local", "linear"): localAlignmentLinear,
+        }
+        if len(self.seq1) * len(self.seq2) > self.max_cells:
+            engine = "linear"
+        if (algo, engine) not in kernels:
+            raise ValueError(f"Unknown alignment algo/engine: algo={algo}, engine={engine}")
+        metrics.count("mtdna_dp_cells_total", len(self.seq1) * len(self.seq2), kernel=f"{algo}_{engine}")
+        with metrics.stage(f"align_{algo}_{engine}"):
+            return kernels[(algo, engine)](self.seq1, self.seq2, gap_pen, match, mismatch)
+
 # Usage example (comment out later)
 '''
 data = parser('synthetic_mtDNA_dataset.fasta', 'fasta')
@@ -0,0 +1,168 @@
+# Vectorized Needleman-Wunsch and Smith-Waterman: same recurrences and tie-breaks as
+# global_alignment_algo / local_alignment_algo, but each matrix row is filled by a few NumPy operations
+
+import numpy as np
+from metrics import timed
+from alignment_result import AlignmentResult, MATCH, MISMATCH, INSERTION, DELETION
+
+STOP, DIAG, UP, LEFT = 0, 1, 2, 3                                     # traceback codes, 2 bits each
+PACK_ROWS = 64                                                        # rows of codes buffered before packing them in one go
+
+def encodeSequence(S):
+    # Sequence as a uint8 array of its characters (code points for non-ASCII text)
+    if isinstance(S, np.ndarray):
+        return S
+    try:
+        return np.frombuffer(S.encode("ascii"), dtype=np.uint8)
+    except UnicodeEncodeError:
+        return np.frombuffer(S.encode("utf-32-le"), dtype=np.uint32)
+
+def scoreDtype(m, n, gap_pen, match, mismatch):
+    # Smallest integer type that holds every score of the matrix, also after shifting column j by j*gap_pen
+    bound = 2 * (m + n + 2) * max(abs(gap_pen), abs(match), abs(mismatch), 1)
+    for dtype in (np.int16, np.int32):
+        if bound < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class SubstitutionProfile:
+    """Per-character rows of shifted substitution scores against B, computed once per distinct character of A."""
+
+    def __init__(self, B, gap_pen, match, mismatch, dtype):
+        self.B = encodeSequence(B)
+        self.hit = match - gap_pen
+        self.miss = mismatch - gap_pen
+        self.dtype = dtype
+        self.rows = {}
+
+    def __getitem__(self, a):
+        if a not in self.rows:
+            self.rows[a] = np.where(self.B == a, self.hit, self.miss).astype(self.dtype)
+        return self.rows[a]
+
+# The rows below are kept in shifted form, S'[i][j] = S[i][j] - j*gap_pen. Then
+#   S'[i][j] = max(S'[i-1][j-1] + s(a, b) - gap_pen, S'[i-1][j] + gap_pen, S'[i][j-1])
+# so the LEFT move costs nothing and the whole row is one running maximum.
+
+def fillRow(prev, subs, gap_pen, first, floor=None):
+    # Shifted scores of row i from row i-1 (prev), the profile row of A[i-1] (subs) and the shifted column 0 score (first)
+    v1 = prev[:-1] + subs                                             # DIAG
+    v2 = prev[1:] + gap_pen                                           # UP
+    cur = np.empty_like(prev)
+    cur[0] = first
+    np.maximum(v1, v2, out=cur[1:])
+    if floor is not None:                                             # Smith-Waterman: a real score of 0 is -j*gap_pen once shifted
+        np.maximum(cur, floor, out=cur)
+    np.maximum.accumulate(cur, out=cur)
+    return cur, v1, v2
+
+def rowCodes(cur, v1, v2, out):
+    # DIAG if v1 wins, else UP if v2 wins, else LEFT: (LEFT - [UP]) >> [DIAG] gives 1, 2 or 3 in that priority
+    np.subtract(LEFT, (cur[1:] == v2).view(np.uint8), out=out)
+    np.right_shift(out, (cur[1:] == v1).view(np.uint8), out=out)
+    return out
+
+def packCodes(codes):
+    # Four 2-bit codes per byte along the last axis, code j sits at bits 2*(j % 4) of byte j // 4
+    return codes[..., 0::4] | (codes[..., 1::4] << 2) | (codes[..., 2::4] << 4) | (codes[..., 3::4] << 6)
+
+@timed("traceback")
+def tracebackPacked(A, B, i, j, packed):
+    # CIGAR operations from (i, j) back to a STOP cell; returns the cell where the alignment starts and the operations, last column first
+    width = packed.shape[1]
+    cells = packed.tobytes()
+    ops = []
+    while True:
+        code = (cells[i*width + (j >> 2)] >> ((j & 3) << 1)) & 3
+        if code == STOP:
+            break
+        if code == DIAG:
+            ops.append(MATCH if A[i-1] == B[j-1] else MISMATCH)
+            i -= 1
+            j -= 1
+        elif code == UP:
+            ops.append(INSERTION)
+            i -= 1
+        else:
+            ops.append(DELETION)
+            j -= 1
+    return i, j, ops
+
+@timed("dp_fill")
+def fillMatrix(A, B, gap_pen, match, mismatch, local):
+    # Fill the DP row by row, keeping two score rows and the packed traceback codes of every row
+    m = len(A)
+    n = len(B)
+    dtype = scoreDtype(m, n, gap_pen, match, mismatch)
+    codesA = encodeSequence(A)
+    profile = SubstitutionProfile(B, gap_pen, match, mismatch, dtype)
+    ramp = np.arange(n + 1, dtype=dtype) * dtype(gap_pen)
+    floor = -ramp if local else None
+    block = np.zeros((PACK_ROWS, 4 * ((n + 4) // 4)), dtype=np.uint8)    # padded so a row packs into whole bytes
+    packed = np.empty((m + 1, block.shape[1] // 4), dtype=np.uint8)
+    if local:
+        prev = floor.copy()                                           # row 0 is all zeros
+        block[0] = STOP
+    else:
+        prev = np.zeros(n + 1, dtype=dtype)                           # row 0 is j*gap_pen
+        block[0, :n+1] = LEFT
+        block[0, 0] = STOP
+    max_score, max_i, max_j = 0, 0, 0
+    for i in range(1, m + 1):
+        r = i % PACK_ROWS
+        block[r, 0] = STOP if local else UP
+        first = 0 if local else i * gap_pen
+        cur, v1, v2 = fillRow(prev, profile[codesA[i-1]], gap_pen, first, floor)
+        codes = rowCodes(cur, v1, v2, block[r, 1:n+1])
+        if local:
+            np.multiply(codes, cur[1:] != floor[1:], out=codes)       # a cell scoring 0 ends the local alignment
+            real = cur + ramp
+            row_max = real.max()
+            if row_max > max_score:                                   # first strictly higher cell in row-major order, as in localAlignment
+                max_score, max_i, max_j = int(row_max), i, int(real.argmax())
+        if r == PACK_ROWS - 1 or i == m:
+            packed[i-r:i+1] = packCodes(block[:r+1])
+        prev = cur
+    if m == 0:
+        packed[0] = packCodes(block[0])
+    if local:
+        return packed, max_score, max_i, max_j
+    return packed, int(prev[n]) + n * gap_pen, m, n
+
+def globalAlignmentNumpy(A, B, gap_pen, match, mismatch):
+    packed, score, i, j = fillMatrix(A, B, gap_pen, match, mismatch, local=False)
+    i, j, ops = tracebackPacked(A, B, i, j, packed)
+    alignment = AlignmentResult.from_traceback(A, B, i, j, ops, score)
+    return alignment, score
+
+def localAlignmentNumpy(A, B, gap_pen, match, mismatch):
+    packed, max_score, max_i, max_j = fillMatrix(A, B, gap_pen, match, mismatch, local=True)
+    i, j, ops = tracebackPacked(A, B, max_i, max_j, packed)
+    alignment = AlignmentResult.from_traceback(A, B, i, j, ops, max_score)
+    return alignment, max_score
+
+def scoreOnly(A, B, gap_pen, match, mismatch, local):
+    # Same DP with two rows only: no traceback codes and no strings, for callers that just need the score
+    m = len(A)
+    n = len(B)
+    dtype = scoreDtype(m, n, gap_pen, match, mismatch)
+    codesA = encodeSequence(A)
+    profile = SubstitutionProfile(B, gap_pen, match, mismatch, dtype)
+    ramp = np.arange(n + 1, dtype=dtype) * dtype(gap_pen)
+    floor = -ramp if local else None
+    prev = floor.copy() if local else np.zeros(n + 1, dtype=dtype)
+    max_score = 0
+    for i in range(1, m + 1):
+        first = 0 if local else i * gap_pen
+        prev = fillRow(prev, profile[codesA[i-1]], gap_pen, first, floor)[0]
+        if local:
+            max_score = max(max_score, int((prev + ramp).max()))
+    if local:
+        return max_score
+    return int(prev[n]) + n * gap_pen
+
+def globalScoreNumpy(A, B, gap_pen, match, mismatch):
+    return scoreOnly(A, B, gap_pen, match, mismatch, local=False)
+
+def localScoreNumpy(A, B, gap_pen, match, mismatch):
+    return scoreOnly(A, B, gap_pen, match, mismatch, local=True)
@@ -1,10 +1,39 @@
-import pandas as pd
-from Bio import SeqIO
+FASTA_COLUMNS = ('seq', 'id', 'name', 'description', 'length')
 
-def parser (file:str, format:str = 'fasta'):
+def read_fasta(file:str):
+    '''
+    Stream the records of a FASTA file without building SeqRecord objects.
+    :param file: filepath for the FASTA file
+    :return: generator of (id, description, seq) tuples, with the same id/description/seq as SeqIO's fasta parser
+    '''
+    try:
+        handle = open(file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"File not found: {file}")
+    with handle:
+        title = None
+        lines = []
+        for line in handle:
+            if line.startswith('>'):
+                if title is not None:
+                    yield record_fields(title, lines)
+                title = line[1:].rstrip()
+                lines = []
+            elif title is not None:
+                lines.append(line.rstrip())
+        if title is not None:
+            yield record_fields(title, lines)
+
+def record_fields(title:str, lines:list):
+    ID = title.split(None, 1)[0] if title else ''
+    seq = ''.join(lines).replace(' ', '').replace('\r', '')
+    return ID, title, seq
+
+def parser (file:str, format:str = 'fasta', columns:list = None):
     '''
     :param file: filepath for the file to be parsed
     :param format: format of the file to be parsed, supports 30+ formats (from SeqIO), defaults to fasta
+    :param columns: for fasta files, only build these columns (any of seq, id, name, description, length) with the streaming reader
     :return: a pandas dataframe containing the parsed sequences for future analysis
     '''
 
@@ -14,6 +43,13 @@ def parser (file:str, format:str = 'fasta'):
     except FileNotFoundError:
         raise FileNotFoundError(f"File not found: {file}")
 
+    if columns is not None and format == 'fasta':
+        return fasta_frame(file, columns)
+
+    # pandas and Biopython are imported on first use: streaming FASTA reads (read_fasta) never need them
+    import pandas as pd
+    from Bio import SeqIO
+
     data = {}
     output = pd.DataFrame()
 
@@ -36,4 +72,20 @@ def parser (file:str, format:str = 'fasta'):
         output['length'] = output['seq'].str.len()
     return output
 
+def fasta_frame(file:str, columns:list):
+    unknown = [column for column in columns if column not in FASTA_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unsupported columns for the streaming FASTA reader: {unknown}")
+    import pandas as pd
+    data = {column: [] for column in columns}
+    n_records = 0
+    for ID, description, seq in read_fasta(file):
+        values = {'seq': seq, 'id': ID, 'name': ID, 'description': description, 'length': len(seq)}
+        for column in columns:
+            data[column].append(values[column])
+        n_records += 1
+    if not n_records:
+        raise ValueError(f"No valid records found in file: {file}")
+    return pd.DataFrame(data, columns=list(columns))
+
 #parser('synthetic_mtDNA_dataset.fasta', 'fasta').to_csv('out.csv')
@@ -1,101 +1,259 @@
 # PART 3 of project
 
-from models import SequenceAlignment, MitochondrialDNA, parser, MotifFinder
-import numpy as np
-import matplotlib.pyplot as plt
+from models import SequenceAlignment, MitochondrialDNA, MotifFinder
+from alignment_result import AlignmentResult
+from parser import read_fasta
+from kmer_counter import KmerCounter, kmerString
+from minhash_sketch import SketchCollection
+from fm_index_query import CollectionFMIndex
+from seed_extend import seedAndExtend
+import os
+import time
+from worker_pool import run_tasks
+from metrics import timed
+import metrics
 
+def iter_genomes(filepath):
+    """Stream genomes from a FASTA file, one MitochondrialDNA at a time."""
+    found = False
+    for ID, description, seq in read_fasta(filepath):
+        found = True
+        yield MitochondrialDNA(seq=seq, ID=ID, description=description)
+    if not found:
+        raise ValueError(f"No valid records found in file: {filepath}")
+
+@timed("load_genomes")
 def load_genomes(filepath):
     """Load genomes from a FASTA file."""
-    data = parser(filepath, 'fasta')
-    genomes = [
-        MitochondrialDNA(
-            seq=data.loc[i]['seq'],
-            ID=data.loc[i]['id'],
-            description=data.loc[i]['description']
-        )
-        for i in range(len(data))
-    ]
+    genomes = list(iter_genomes(filepath))
     return genomes
 
+@timed("align_genomes")
 def align_genomes(genome1, genome2):
-    """Align two genomes and return the alignment result."""
+    """Align two genomes and return the alignment result (an AlignmentResult, unpacking into the three alignment strings)."""
     aligner = SequenceAlignment(genome1.seq, genome2.seq)
-    aligned_seq1, comparison_line, aligned_seq2 = aligner.align_sequences()
-    return aligned_seq1, comparison_line, aligned_seq2
-
-def visualize_differences_bar(seq1, seq2, label1, label2):
-    """Visualize differences between two aligned sequences."""
-    matches = mismatches = gaps = 0
-    block_size = 60
-    length = len(seq1)
-    result = []
-
-    for i in range(0, length, block_size):
-        block1 = seq1[i:i+block_size]
-        block2 = seq2[i:i+block_size]
-        comp_line = ""
-        
-        for a, b in zip(block1, block2):
-            if a == b and a != "-":
-                comp_line += "*"
-                matches += 1
-            elif a == '-' or b == '-':
-                comp_line += " "
-                gaps += 1
-            else:
-                comp_line += "|"
-                mismatches += 1
-            
-        result.append({
-            "block1": block1,
-            "block2": block2,
-            "comp_line": comp_line
-        })
+    return aligner.align_sequences()
 
+def visualize_differences_bar(seq1, seq2=None, label1=None, label2=None, block_size=60, start=0, stop=None):
+    """
+    Visualize differences between two aligned sequences, block_size columns per block.
+    seq1 may also be an AlignmentResult (seq2 is then not needed): counts come from its CIGAR without a pass over the strings.
+    Only blocks start..stop-1 are rendered (all of them by default); summary["blocks"] is the total number of blocks.
+    """
+    alignment = seq1 if isinstance(seq1, AlignmentResult) else AlignmentResult.from_aligned(seq1, seq2)
+    result = alignment.blocks(start, stop, width=block_size)
     summary = {
-        "matches": matches,
-        "mismatches": mismatches,
-        "gaps": gaps,
-        "total": length
+        "matches": alignment.matches,
+        "mismatches": alignment.mismatches,
+        "gaps": alignment.gaps,
+        "total": alignment.length,
+        "blocks": alignment.block_count(block_size)
     }
     return result, summary
 
-def find_motifs(genomes, motif):
+@timed("find_motifs")
+def find_motifs(genomes, motif, index=None, max_mismatches=0, max_edits=0):
     """
     Search for a motif in each genome and return the results.
     :param genomes: List of genome objects.
     :param motif: The motif to search for.
-    :return: List of dictionaries containing motif search results for each genome.
+    :param index: optional CollectionFMIndex over the genomes, searched once for all of them.
+    :param max_mismatches: substitutions allowed in an occurrence (or max_edits for substitutions, insertions and deletions).
+    :return: List of dictionaries containing motif search results for each genome, with the distance of each position when differences are allowed.
     """
     results = []
+    motif_finder = MotifFinder(motif)
+    found = motif_finder.search_collection(index, max_mismatches, max_edits) if index is not None else None
     for genome in genomes:
-        motif_finder = MotifFinder(motif)
-        positions = motif_finder.search_motif(genome.seq)
-        results.append({
+        if found is not None:
+            hits = found.get(genome.ID, [])
+        else:
+            hits = motif_finder.search_motif(genome, max_mismatches, max_edits)  # the genome's FM-index is built once and reused by later queries
+        result = {
             "id": genome.ID,
             "description": genome.description,
             "motif": motif,
-            "count": motif_finder.count_occurrences(genome.seq),
-            "positions": positions
+            "count": len(hits),
+            "positions": hits
+        }
+        if max_mismatches or max_edits:
+            result["positions"] = [offset for offset, _ in hits]
+            result["distances"] = [distance for _, distance in hits]
+        results.append(result)
+    return results
+
+@timed("search_fragment")
+def search_fragment(genomes, query, index=None, top_n=None, progress=None, **params):
+    """
+    Local search of a sequence fragment (e.g. a 300-2000 bp read or gene) against every genome: exact k-mer seeds from
+    the FM-index, chained, then banded Smith-Waterman around each chain only.
+    :param genomes: List of genome objects, in the order of the index.
+    :param query: The fragment to search for.
+    :param index: optional CollectionFMIndex over the genomes, built here if None.
+    :param top_n: number of hits to return (all of them if None).
+    :param progress: optional callback progress(done, total) over the genomes holding seeds.
+    :param params: seed, chain and scoring parameters passed on to seedAndExtend (k, step, band, gap_pen, ...).
+    :return: List of dictionaries describing each local hit, best score first.
+    """
+    query = "".join(query.split()).upper()
+    if index is None:
+        index = CollectionFMIndex([g.codes for g in genomes], [g.ID for g in genomes])
+    hits = seedAndExtend(index, [g.seq for g in genomes], query, progress=progress, **params)
+    metrics.count("mtdna_dp_cells_total", sum(cells for _, _, _, cells in hits), kernel="seed_extend")
+    results = []
+    for sequence, alignment, seeds, cells in hits[:top_n]:
+        results.append({
+            "id": genomes[sequence].ID,
+            "score": alignment.score,
+            "identity": alignment.identity,
+            "query_start": alignment.start1,
+            "query_end": alignment.end1,
+            "target_start": alignment.start2,
+            "target_end": alignment.end2,
+            "cigar": alignment.cigar,
+            "seeds": seeds,
+            "cells": cells,
+            "alignment": alignment
         })
     return results
 
-def compare_to_reference(reference, genomes):
-    """Compare all genomes to a reference genome."""
+@timed("find_conserved_motifs")
+def find_conserved_motifs(genomes, k=8, top_n=20, counter=None):
+    """
+    Find the k-mers shared by the most genomes.
+    :param genomes: List of genome objects.
+    :param k: motif length.
+    :param top_n: number of motifs to return.
+    :param counter: optional KmerCounter already built over the genomes.
+    :return: the motifs (motif, number and percentage of genomes containing it, total occurrences) and a conservation
+             matrix with the count of each motif in each genome.
+    """
+    counter = counter or KmerCounter([genome.codes for genome in genomes], [genome.ID for genome in genomes], k)
+    kmers, genome_counts, total_counts = counter.topConserved(top_n)
+    motifs = [{
+        "motif": kmerString(kmer, counter.k),
+        "genomes": int(shared),
+        "conservation": round(100 * int(shared) / len(genomes), 2) if genomes else 0.0,
+        "occurrences": int(total)
+    } for kmer, shared, total in zip(kmers, genome_counts, total_counts)]
+    counts = counter.matrix(kmers)
+    conservation_matrix = {
+        "motifs": [motif["motif"] for motif in motifs],
+        "rows": [{"id": ID, "counts": row.tolist()} for ID, row in zip(counter.ids, counts)]
+    }
+    return motifs, conservation_matrix
+
+@timed("rank_by_sketch")
+def rank_by_sketch(reference, genomes, top_n=None, min_similarity=None, sketches=None):
+    """
+    Rank genomes by the similarity of their MinHash sketch to the reference's, without aligning anything.
+    :param min_similarity: lowest estimated identity (%) kept
+    :param sketches: SketchCollection covering the genomes (e.g. the dataset's), built from the genomes' cached sketches if None
+    :return: list of (genome, estimated identity %), closest first, at most top_n of them
+    """
+    if sketches is None:
+        sketches = SketchCollection([g.get_sketch() for g in genomes], [g.ID for g in genomes])
+    by_id = {g.ID: g for g in genomes}
+    ranked = sketches.rank(reference.get_sketch(sketches.k, sketches.scaled), min_identity=min_similarity)
+    candidates = [(by_id[ID], estimate) for ID, estimate in ranked if ID in by_id]
+    return candidates if top_n is None else candidates[:top_n]
+
+def prefilter_targets(reference, genomes, top_n, min_similarity, sketches):
+    """Targets worth a full alignment (all of them unless top_n or min_similarity is given) and their estimated identities."""
+    if top_n is None and min_similarity is None:
+        return genomes, {}
+    candidates = rank_by_sketch(reference, genomes, top_n, min_similarity, sketches)
+    return [g for g, _ in candidates], {g.ID: estimate for g, estimate in candidates}
+
+COMPARE_METRICS = ("alignment", "edit_distance")
+
+def check_metric(metric):
+    if metric not in COMPARE_METRICS:
+        raise ValueError(f"Unknown metric: {metric}, expected one of {', '.join(COMPARE_METRICS)}")
+
+def pair_similarity(aligner, metric, gap_pen=-2, match=1, mismatch=-1):
+    """
+    Score, similarity (%) and edit distance of a pair for the metric: "alignment" (global alignment, no edit distance)
+    or "edit_distance" (bit-parallel Levenshtein distance and the identity derived from it, no alignment score).
+    """
+    if metric == "edit_distance":
+        distance, identity = aligner.get_edit_distance()
+        return None, identity, distance
+    similarity = aligner.get_similarity(gap_pen, match, mismatch)
+    score = aligner.get_alignment_scores(gap_pen, match, mismatch)  # aligned once, the score comes from the same cached result
+    return score, similarity, None
+
+@timed("compare_to_reference")
+def compare_to_reference(reference, genomes, progress=None, top_n=None, min_similarity=None, sketches=None, metric="alignment"):
+    """Compare all genomes to a reference genome.
+    :param progress: optional callback progress(done, total), called after each target
+    :param top_n, min_similarity: only align the top_n genomes closest to the reference, and/or those with an estimated
+        identity of at least min_similarity (%), as ranked by their MinHash sketches (see rank_by_sketch)
+    :param metric: "alignment" for the global alignment score and similarity, "edit_distance" for the much cheaper
+        edit distance and its identity
+    """
+    check_metric(metric)
+    genomes, estimates = prefilter_targets(reference, genomes, top_n, min_similarity, sketches)
     results = []
     for target in genomes:
-        aligner = SequenceAlignment(reference.seq, target.seq)
-        _, comp, _ = aligner.align_sequences()
-        score = aligner.get_alignment_scores()
-        matches = comp.count("*")
-        total = len(comp)
-        similarity = (matches / total) * 100 if total > 0 else 0
+        score, similarity, distance = pair_similarity(SequenceAlignment(reference.seq, target.seq), metric)
+        results.append({
+            "id": target.ID,
+            "score": score,
+            "similarity": similarity,
+            "edit_distance": distance,
+            "estimated_similarity": estimates.get(target.ID)
+        })
+        if progress:
+            progress(len(results), len(genomes))
+    return results
+
+def compare_pair(reference_seq, target_seq, metric):
+    """Score, similarity, edit distance and time taken of one reference/target pair (a task of the process pool)."""
+    start = time.perf_counter()
+    score, similarity, distance = pair_similarity(SequenceAlignment(reference_seq, target_seq), metric)
+    return score, similarity, distance, time.perf_counter() - start
+
+@timed("compare_to_reference_parallel")
+def compare_to_reference_parallel(reference, genomes, workers=None, min_parallel=8, progress=None, top_n=None, min_similarity=None, sketches=None, metric="alignment"):
+    """
+    Compare all genomes to a reference genome, spreading the alignments over the shared process pool (worker_pool).
+    With top_n or min_similarity only the candidates passing the MinHash prefilter are aligned, and metric selects the
+    alignment or the edit distance, as in compare_to_reference.
+    :param workers: alignments running at once, defaults to the number of CPUs
+    :param min_parallel: below this many genomes (or with a single worker) the alignments run serially in this process
+    :param progress: optional callback progress(done, total), called as results come in
+    :return: results in the order of genomes (closest first when prefiltered), each with the time its alignment took
+    """
+    check_metric(metric)
+    genomes, estimates = prefilter_targets(reference, genomes, top_n, min_similarity, sketches)
+    reference_seq = reference.seq
+    workers = workers or os.cpu_count() or 1
+    if len(genomes) < min_parallel or workers == 1:
+        outcomes = []
+        for target in genomes:
+            outcomes.append(compare_pair(reference_seq, target.seq, metric))
+            if progress:
+                progress(len(outcomes), len(genomes))
+    else:
+        # Each task carries its pair: the pool is shared, so nothing is kept in the workers between calls
+        outcomes = [None] * len(genomes)
+        tasks = ((reference_seq, target.seq, metric) for target in genomes)
+        for done, (number, outcome) in enumerate(run_tasks(compare_pair, tasks, workers), 1):
+            outcomes[number] = outcome
+            if progress:
+                progress(done, len(genomes))
+    results = []
+    for target, (score, similarity, distance, elapsed) in zip(genomes, outcomes):
         results.append({
             "id": target.ID,
             "score": score,
-            "similarity": similarity
+            "similarity": similarity,
+            "edit_distance": distance,
+            "estimated_similarity": estimates.get(target.ID),
+            "time": elapsed
         })
     return results
 
 if __name__ == "__main__":
-    print("This script is meant to be imported, not executed directly.")
+    print("This script is meant to be imported, not executed directly; use cli.py for batch analyses from the command line.")
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import matplotlib
+from matplotlib.figure import Figure
+from jobs import QueueFull
+import metrics
+
+# Plots are drawn on standalone Figure objects (no pyplot global state), so several can render at once in worker threads
+
+def render_gc_bar(path, ids, gc_contents):
+    """GC content of every sequence, colors repeating after the 20 of the tab20 colormap."""
+    cmap = matplotlib.colormaps['tab20']
+    colors = [cmap(i % cmap.N) for i in range(len(ids))]
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    ax.bar(ids, gc_contents, color=colors, width=0.5)
+    ax.set_xlabel("Sequence ID")
+    ax.set_ylabel("GC Content (%)")
+    ax.set_title("GC Content of Sequences")
+    ax.set_ylim(0, 100)  # Set y-axis to percentage scale
+    ax.tick_params(axis="x", labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+    fig.tight_layout()
+    fig.savefig(path)
+
+def render_gc_pie(path, total_gc_bases, total_at_bases):
+    """Share of GC and AT bases over the whole file."""
+    fig = Figure(figsize=(8, 8))
+    ax = fig.add_subplot()
+    ax.pie(
+        [total_gc_bases, total_at_bases],
+        labels=["GC Content", "AT Content"],
+        autopct='%1.1f%%',
+        colors=["orange", "skyblue"],
+        startangle=140
+    )
+    ax.set_title("Overall GC Content in File")
+    fig.savefig(path)
+
+def render_gc_histogram(path, gc_contents, bins=10):
+    """Distribution of the GC content of the sequences."""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    ax.hist(gc_contents, bins=bins, color='teal', edgecolor='black')
+    ax.set_title("GC Content Distribution Across Species")
+    ax.set_xlabel("GC Content (%)")
+    ax.set_ylabel("Frequency")
+    fig.savefig(path)
+
+class PlotCache:
+    """
+    Rendered plots on disk, named after the dataset, the plot and a hash of its parameters: a plot is rendered
+    once per dataset and parameters, by a background job queue, and served as a static file afterwards.
+    """
+
+    def __init__(self, folder:str, jobs, url_prefix:str = '/static/plots'):
+        self.folder = folder
+        self.jobs = jobs
+        self.url_prefix = url_prefix
+        self.pending = {}  # file name -> job rendering it
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def file_name(self, dataset_id:str, name:str, params:dict):
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+        return f"{dataset_id}-{name}-{digest}.png"
+
+    def request(self, dataset_id:str, name:str, render, *args, **params):
+        """
+        URL of the plot and, if it still has to be drawn, the job drawing it (queued on the first request).
+        render(path, *args, **params) draws the plot; args must be determined by the dataset and params.
+        :return: url, job (None once the image exists)
+        """
+        file_name = self.file_name(dataset_id, name, params)
+        path = os.path.join(self.folder, file_name)
+        url = f"{self.url_prefix}/{file_name}"
+        with self.lock:
+            if os.path.exists(path):
+                return url, None
+            job = self.pending.get(file_name)
+            if job is not None and job.status not in ("failed", "cancelled"):
+                return url, job
+            try:
+                job = self.jobs.submit('plot', self.render, path, render, args, params)
+                self.pending[file_name] = job
+                return url, job
+            except QueueFull:
+                pass
+        self.render(path, render, args, params)  # too many plots waiting: draw this one in the request (render takes the lock)
+        return url, None
+
+    def render(self, path, render, args, params, progress=None):
+        # Draw into a temporary file and move it into place, so a half-written image is never served
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.png"
+        try:
+            with metrics.stage("plot_render"):
+                render(tmp_path, *args, **params)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self.lock:
+            self.pending.pop(os.path.basename(path), None)
+        if progress:
+            progress(1, 1)
@@ -0,0 +1,116 @@
+# Seed-and-extend local search of a query against every sequence of a CollectionFMIndex:
+#   1. seeds: exact k-mers of the query (every step bases) located in the whole collection by backward search
+#   2. chains: per sequence, collinear seeds (increasing in both query and target, close diagonals) joined by a small DP
+#   3. extension: Smith-Waterman restricted to the diagonals around each chain (localAlignmentBanded)
+# so the DP only covers cells near real homology instead of the full query x genome matrix.
+
+import numpy as np
+from banded_alignment_algo import localAlignmentBanded
+from alignment_result import AlignmentResult
+
+def findSeeds(index, query, k, step, max_occurrences):
+    # Exact matches of the query's k-mers as arrays (sequence number, query offset, target offset).
+    # K-mers occurring more than max_occurrences times in the collection (repeats) are skipped
+    sequences, query_offsets, target_offsets = [], [], []
+    for q in range(0, len(query) - k + 1, step):
+        top, bottom = index.interval(query[q:q+k])
+        if bottom == top or bottom - top > max_occurrences:
+            continue
+        positions = index.sa[top:bottom].astype(np.int64)
+        sequence = np.searchsorted(index.starts, positions, side="right") - 1
+        sequences.append(sequence)
+        query_offsets.append(np.full(len(positions), q, dtype=np.int64))
+        target_offsets.append(positions - index.starts[sequence])
+    if not sequences:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return np.concatenate(sequences), np.concatenate(query_offsets), np.concatenate(target_offsets)
+
+def chainSeeds(query_offsets, target_offsets, k, max_gap, max_drift, lookback=64):
+    # Chains of collinear seeds of one sequence, best first, as (score, seed indexes) with seeds used at most once.
+    # A seed extends a chain ending in an earlier seed (smaller query and target offsets, at most max_gap bases back
+    # on the target) if their diagonals differ by at most max_drift; it gains the new bases it covers minus the drift
+    order = np.lexsort((query_offsets, target_offsets))
+    q = query_offsets[order].tolist()
+    t = target_offsets[order].tolist()
+    n = len(q)
+    score = [k] * n
+    parent = [-1] * n
+    for j in range(n):
+        for i in range(j - 1, max(j - lookback, 0) - 1, -1):
+            if t[j] - t[i] > max_gap:
+                break
+            if q[i] >= q[j] or t[i] >= t[j]:
+                continue
+            drift = abs((t[j] - q[j]) - (t[i] - q[i]))
+            if drift > max_drift:
+                continue
+            gain = min(q[j] - q[i], t[j] - t[i], k) - drift
+            if score[i] + gain > score[j]:
+                score[j] = score[i] + gain
+                parent[j] = i
+    chains = []
+    used = [False] * n
+    for end in sorted(range(n), key=lambda j: -score[j]):
+        if used[end]:
+            continue
+        members = []
+        j = end
+        while j != -1 and not used[j]:
+            members.append(j)
+            used[j] = True
+            j = parent[j]
+        # A chain cut short by seeds of a better chain keeps only its own part, and is rescored by its length
+        chain_score = score[end] - (score[j] if j != -1 else 0)
+        chains.append((chain_score, order[np.array(members[::-1])]))
+    chains.sort(key=lambda chain: -chain[0])
+    return chains
+
+def extendChain(query, target, query_offsets, target_offsets, band, gap_pen, match, mismatch):
+    # Banded Smith-Waterman of the query against the part of target reached by the chain's diagonals widened by band.
+    # Returns the alignment in target coordinates and the number of DP cells computed
+    diagonals = target_offsets - query_offsets
+    low, high = int(diagonals.min()) - band, int(diagonals.max()) + band
+    window_start = max(0, low)
+    window_end = min(len(target), len(query) + high)
+    lo, hi = low - window_start, high - window_start
+    window = target[window_start:window_end]
+    alignment, score = localAlignmentBanded(query, window, gap_pen, match, mismatch, lo, hi)
+    # Same CIGAR, with the full target as second sequence so the coordinates are the genome's
+    result = AlignmentResult(query, target, alignment.start1, window_start + alignment.start2, alignment.ops, alignment.lengths, score)
+    return result, (len(query) + 1) * (hi - lo + 1)
+
+def seedAndExtend(index, targets, query, k=16, step=4, max_occurrences=1000, max_gap=500, max_drift=32, band=32,
+                  min_chain_score=32, max_chains=3, gap_pen=-2, match=1, mismatch=-1, progress=None):
+    '''
+    Local hits of the query in every sequence of the index.
+    :param index: CollectionFMIndex over the sequences
+    :param targets: the indexed sequences as strings, in index order (for the extension)
+    :param k, step: seed length, and distance between the query offsets seeds are taken from
+    :param max_gap, max_drift: largest target distance and diagonal difference between consecutive seeds of a chain
+    :param band: diagonals added on both sides of a chain for its extension
+    :param min_chain_score, max_chains: chains scoring less are dropped, and at most max_chains are extended per sequence
+    :param progress: optional callback progress(done, total) over the sequences holding seeds
+    :return: hits as (sequence number, AlignmentResult, number of seeds in the chain, DP cells computed), best score first
+    '''
+    if len(query) < k:
+        raise ValueError(f"Query must be at least {k} bases long")
+    sequences, query_offsets, target_offsets = findSeeds(index, query, k, step, max_occurrences)
+    hits = []
+    order = np.argsort(sequences, kind="stable")
+    bounds = np.flatnonzero(np.diff(sequences[order])) + 1
+    groups = np.split(order, bounds) if len(order) else []
+    for done, group in enumerate(groups, 1):
+        sequence = int(sequences[group[0]])
+        chains = chainSeeds(query_offsets[group], target_offsets[group], k, max_gap, max_drift)
+        for chain_score, members in chains[:max_chains]:
+            if chain_score < min_chain_score:
+                break
+            seeds = group[members]
+            result, cells = extendChain(query, targets[sequence], query_offsets[seeds], target_offsets[seeds], band, gap_pen, match, mismatch)
+            if result.score > 0:
+                hits.append((sequence, result, len(seeds), cells))
+        if progress:
+            progress(done, len(groups))
+    hits.sort(key=lambda hit: -hit[1].score)
+    return hits
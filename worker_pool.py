@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+# One process pool per process, created on first use and shared by every parallel computation (reference comparisons,
+# all-vs-all rows), so workers are started once rather than per call. Workers are started through a forkserver: the web
+# app is threaded, and a fork would copy other threads' locks in whatever state they are in. Tasks carry their inputs,
+# as the pool outlives any one computation, and bring back the metrics recorded in the worker with their result.
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The shared pool, with one worker per CPU."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+def reset_pool(pool):
+    # A pool whose worker died cannot run anything more: forget it so the next call starts a new one
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def run_tasks(func, tasks, workers:int):
+    """
+    func(*task) for every task (tuples of arguments, from any iterable) on the shared pool, at most workers at a time.
+    Tasks are only taken from the iterable as slots free up, so large inputs are not all pickled at once. The stage
+    timings and counters a task records in its worker are merged into this process's metrics registry.
+    :return: generator of (task number, result), in completion order; if it is closed early or the caller raises
+             (e.g. a cancelled job), the tasks not started yet are dropped
+    """
+    pool = get_pool()
+    options = metrics.task_options()
+    tasks = enumerate(tasks)
+    running = {}
+    try:
+        while True:
+            while len(running) < workers:
+                item = next(tasks, None)
+                if item is None:
+                    break
+                running[pool.submit(metrics.call_recorded, options, func, *item[1])] = item[0]
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                number = running.pop(future)
+                result, recorded = future.result()
+                if recorded:
+                    metrics.registry.merge(recorded)
+                yield number, result
+    except BrokenProcessPool:
+        reset_pool(pool)
+        raise
+    finally:
+        for future in running:
+            future.cancel()